@@ -0,0 +1,296 @@
+import socket  # Модуль для сетевых соединений
+import selectors  # Ожидание подключений ко всем тестовым портам в одном потоке
+import argparse  # Модуль для парсинга аргументов командной строки
+import sys  # Модуль для системных функций
+import os  # Дескрипторы и память процесса (/proc)
+import time  # Модуль для работы со временем
+import json  # Отчет в формате JSON
+import platform  # Версия Python и ОС для отчета
+import threading  # Поток замера пиковых значений
+import multiprocessing  # Тестовые цели - в отдельном процессе
+from array import array  # Длительности проверок без лишних объектов
+
+import scanner  # Сканер, который измеряем
+
+try:
+    import resource  # Пиковая память процесса, если нет /proc
+except ImportError:
+    resource = None
+
+# Доступные движки: имя -> функция запуска (сканер, хост, порты, подключения, опции)
+ENGINES = {
+    "async": lambda scan, host, ports, threads, opts: scan.scan_range(ports.start, ports.stop - 1, threads),
+    "sharded": lambda scan, host, ports, threads, opts: [
+        result for _, result in scan.iter_scan_sharded([host], ports, opts.workers, threads)],
+    "banner": lambda scan, host, ports, threads, opts: scan.scan_range(ports.start, ports.stop - 1, threads),
+}
+
+# Приветствие тестовых "открытых" сервисов (чтобы движку banner было что разбирать)
+GREETING = b"SSH-2.0-Benchmark\r\n"
+
+# Тестовые цели на loopback: открытые, закрытые и "фильтруемые" порты
+def run_targets(host, base_port, count, open_share, filtered, ready, stop):
+    # Выполняется в отдельном процессе, чтобы не влиять на замеры сканера
+    # ready - канал для отправки раскладки портов, stop - событие остановки
+    scanner._raise_fd_limit(count + scanner.FD_RESERVE)  # Открытым портам нужны дескрипторы
+    step = max(1, round(1 / open_share)) if open_share > 0 else 0  # Каждый step-й порт - открыт
+    selector = selectors.DefaultSelector()
+    layout = {"OPEN": [], "FILTERED": [], "CLOSED": [], "BUSY": []}  # BUSY - порт занят кем-то еще
+    held = []  # Сокеты, которые должны жить до конца
+    # "Фильтруемые" порты - равномерно по диапазону: большинство из них проверяется уже
+    # с адаптивным таймаутом, а не с полным --timeout первых проверок
+    filtered = min(filtered, count)
+    filtered_offsets = {(2 * i + 1) * count // (2 * filtered) for i in range(filtered)}
+
+    for offset in range(count):
+        port = base_port + offset
+        if offset in filtered_offsets:
+            kind = "FILTERED"
+        elif step and offset % step == 0:
+            kind = "OPEN"
+        else:  # Никто не слушает - подключение получает RST
+            layout["CLOSED"].append(port)
+            continue
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            listener.bind((host, port))
+        except OSError:  # Порт уже занят - результат для него не проверяем
+            listener.close()
+            layout["BUSY"].append(port)
+            continue
+        if kind == "OPEN":
+            listener.listen(1024)
+            listener.setblocking(False)
+            selector.register(listener, selectors.EVENT_READ)
+        else:
+            # Очередь подключений заполнена и никто не принимает - новые SYN отбрасываются,
+            # как у порта за межсетевым экраном
+            listener.listen(0)
+            for _ in range(8):
+                client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                client.settimeout(0.2)
+                try:
+                    client.connect((host, port))
+                except OSError:  # Очередь заполнена
+                    client.close()
+                    break
+                held.append(client)
+        held.append(listener)
+        layout[kind].append(port)
+
+    ready.send(layout)  # Цели готовы
+    while not stop.is_set():
+        for key, _ in selector.select(timeout=0.1):
+            try:
+                conn, _ = key.fileobj.accept()  # Принимаем, здороваемся и сразу закрываем
+                conn.setblocking(False)
+                conn.send(GREETING)
+                conn.close()
+            except OSError:
+                pass
+    for sock in held:
+        sock.close()
+
+# Метрики сканера, которые еще и запоминают длительность каждой попытки подключения
+# (в результатах время округлено до миллисекунды - на loopback это почти всегда 0)
+class LatencyMetrics(scanner.ScanMetrics):
+    def __init__(self, total=None):
+        super().__init__(total)
+        self.latencies = array('d')  # Длительности попыток, сек
+
+    def probe_finished(self, elapsed, answered=True, code=None):
+        super().probe_finished(elapsed, answered, code)
+        self.latencies.append(elapsed)
+
+    def counters(self):  # В воркер-процессе (-w): отправляем только новые замеры
+        counters = super().counters()
+        counters["latencies"], self.latencies = self.latencies, array('d')
+        return counters
+
+    def merge(self, shard, counters):  # Замеры воркеров собираются здесь
+        self.latencies.extend(counters.pop("latencies", ()))
+        super().merge(shard, counters)
+
+# Замер пиковых потоков, дескрипторов и памяти во время прогона
+class PeakSampler(threading.Thread):
+    def __init__(self, interval=0.01, exclude=()):
+        super().__init__(daemon=True)
+        self.interval = interval  # Период замера, сек
+        self.exclude = {process.pid for process in exclude}  # Процессы, которые не считаются (цели)
+        self.stopped = threading.Event()
+        self.threads = 0  # Пиковое число потоков (без потока замера)
+        self.fds = None  # Пиковое число дескрипторов (None - не поддерживается)
+        self.rss = None  # Пиковая память, байты (None - не поддерживается)
+
+    def run(self):
+        while True:
+            self.sample()
+            if self.stopped.wait(self.interval):
+                break
+
+    def sample(self):
+        self.threads = max(self.threads, threading.active_count() - 1)
+        pids = [os.getpid()] + [process.pid for process in multiprocessing.active_children()
+                                if process.pid not in self.exclude]  # Вместе с воркерами -w
+        fds = rss = 0
+        try:
+            for pid in pids:
+                fds += len(os.listdir(f"/proc/{pid}/fd"))
+                with open(f"/proc/{pid}/statm") as f:
+                    rss += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):  # Нет /proc или процесс уже завершился
+            return
+        self.fds = max(self.fds or 0, fds)
+        self.rss = max(self.rss or 0, rss)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        if self.rss is None and resource is not None:  # Нет /proc - пиковая память процесса целиком
+            self.rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+# Процентиль по отсортированному списку (ближайший ранг)
+def percentile(values, share):
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(share * len(values)) - 1))]
+
+# Один прогон движка
+def run_once(engine, host, ports, threads, layout, opts, exclude):
+    grabber = scanner.BannerGrabber(opts.banner_timeout) if engine == "banner" else None
+    metrics = LatencyMetrics(len(ports))  # Длительность каждой попытки - через хук метрик
+    scan = scanner.PortScanner(host, opts.timeout, not opts.fixed_timeout, opts.retries,
+                               banner_grabber=grabber, metrics=metrics)
+    sampler = PeakSampler(exclude=exclude)
+    sampler.start()
+    start_time = time.perf_counter()
+    try:
+        results = list(ENGINES[engine](scan, host, ports, threads, opts))
+    finally:
+        elapsed = time.perf_counter() - start_time
+        sampler.stop()
+
+    latencies = sorted(latency * 1000 for latency in metrics.latencies)  # Время каждой попытки, мс
+    counts = scanner.ScanStats.from_results(results).counts
+    expected = {port: status for status in ("OPEN", "CLOSED", "FILTERED") for port in layout[status]}
+    mismatches = sum(1 for port, status, _, _ in results
+                     if port in expected and expected[port] != status)  # Неверно определенные порты
+    return {
+        "engine": engine,
+        "ports": len(ports),
+        "threads": threads,
+        "workers": opts.workers if engine == "sharded" else 1,
+        "seconds": round(elapsed, 3),
+        "ports_per_sec": round(len(results) / elapsed, 1) if elapsed else None,
+        "probes": len(latencies),
+        "latency_p50_ms": round(percentile(latencies, 0.50), 3) if latencies else None,
+        "latency_p99_ms": round(percentile(latencies, 0.99), 3) if latencies else None,
+        "peak_threads": sampler.threads,
+        "peak_fds": sampler.fds,
+        "peak_rss_mb": round(sampler.rss / 2**20, 1) if sampler.rss else None,
+        "counts": counts,
+        "mismatches": mismatches,
+    }
+
+# Список чисел через запятую: "1000,5000"
+def int_list(value):
+    return [int(part) for part in value.split(',') if part.strip()]
+
+# Аргументы командной строки
+parser = argparse.ArgumentParser(
+    description='Бенчмарк сканера портов на тестовых целях (loopback)',
+    epilog='Примеры использования:\n'
+           '  python benchmark.py\n'
+           '  python benchmark.py --ports 1000,10000 --threads 100,500 --engines async,sharded -w 2\n'
+           '  python benchmark.py -o bench.json',
+    formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--ports', type=int_list, default=[1000],  # Размеры диапазона
+                   help='Сколько портов сканировать, через запятую (по умолчанию: 1000)')
+parser.add_argument('--threads', type=int_list, default=[100, 500],  # Уровни параллелизма
+                   help='Одновременных подключений, через запятую (по умолчанию: 100,500)')
+parser.add_argument('--engines', default='async,sharded',  # Движки
+                   help=f'Движки через запятую: {", ".join(ENGINES)} (по умолчанию: async,sharded)')
+parser.add_argument('-w', '--workers', type=int, default=2,  # Процессы для sharded
+                   help='Количество процессов для движка sharded (по умолчанию: 2)')
+parser.add_argument('--base-port', type=int, default=40000,  # Начало диапазона целей
+                   help='Первый порт тестовых целей (по умолчанию: 40000)')
+parser.add_argument('--open', type=float, default=0.05,  # Доля открытых портов
+                   help='Доля открытых портов (по умолчанию: 0.05)')
+parser.add_argument('--filtered', type=int, default=5,  # "Фильтруемые" порты
+                   help='Сколько портов имитируют фильтрацию (по умолчанию: 5)')
+parser.add_argument('--timeout', type=float, default=0.5,  # Таймаут сканера
+                   help='Максимальный таймаут соединения в секундах (по умолчанию: 0.5)')
+parser.add_argument('--fixed-timeout', action='store_true',  # Отключить адаптивный таймаут
+                   help='Всегда ждать полный --timeout, не подбирать таймаут по RTT')
+parser.add_argument('--retries', type=int, default=1,  # Повторные попытки
+                   help='Повторные попытки для портов без ответа (по умолчанию: 1)')
+parser.add_argument('--banner-timeout', type=float, default=0.2,  # Для движка banner
+                   help='Таймаут чтения баннера для движка banner (по умолчанию: 0.2)')
+parser.add_argument('--repeat', type=int, default=1,  # Повторы
+                   help='Сколько раз повторить каждый прогон (по умолчанию: 1)')
+parser.add_argument('-o', '--output', type=str,  # Файл отчета
+                   help='Сохранить отчет JSON в файл (по умолчанию - вывод на экран)')
+
+# Запуск бенчмарка
+def main():
+    args = parser.parse_args()
+    engines = [engine.strip() for engine in args.engines.split(',') if engine.strip()]
+    unknown = [engine for engine in engines if engine not in ENGINES]
+    if unknown:
+        print(f"Ошибка! неизвестные движки: {', '.join(unknown)}", file=sys.stderr)
+        sys.exit(1)
+    if not args.ports or not args.threads or min(args.ports + args.threads) < 1 or args.workers < 1:
+        print("Ошибка! число портов, подключений и процессов должно быть не меньше 1", file=sys.stderr)
+        sys.exit(1)
+    count = max(args.ports)
+    if args.base_port < 1 or args.base_port + count - 1 > 65535:
+        print("Ошибка! диапазон тестовых портов выходит за пределы 1-65535", file=sys.stderr)
+        sys.exit(1)
+
+    host = "127.0.0.1"
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    stop = multiprocessing.Event()
+    targets = multiprocessing.Process(target=run_targets, daemon=True, args=(
+        host, args.base_port, count, args.open, args.filtered, sender, stop))
+    targets.start()
+    layout = receiver.recv()  # Ждем, пока цели будут готовы
+    print(f"Цели: открыто {len(layout['OPEN'])}, фильтруется {len(layout['FILTERED'])}, "
+          f"закрыто {len(layout['CLOSED'])}, занято другими {len(layout['BUSY'])}", file=sys.stderr)
+
+    runs = []
+    try:
+        for ports_count in args.ports:
+            ports = range(args.base_port, args.base_port + ports_count)
+            for threads in args.threads:
+                for engine in engines:
+                    for _ in range(args.repeat):
+                        run = run_once(engine, host, ports, threads, layout, args, [targets])
+                        print(f"{engine:8s} портов {ports_count:6d}, подключений {threads:5d}: "
+                              f"{run['ports_per_sec']} портов/сек", file=sys.stderr)
+                        runs.append(run)
+    except KeyboardInterrupt:  # Ctrl+C - отчет по уже выполненным прогонам
+        print("\nБенчмарк прерван (Ctrl+C)", file=sys.stderr)
+    finally:
+        stop.set()
+        targets.join()
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timeout": args.timeout,
+        "targets": {status: len(ports) for status, ports in layout.items()},
+        "runs": runs,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+        print(f"Отчет сохранен в файл: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
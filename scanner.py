@@ -1,9 +1,30 @@
 import socket  # Модуль для сетевых соединений
-import threading  # Модуль для многопоточности
+import asyncio  # Модуль для асинхронного ввода-вывода
 import argparse  # Модуль для парсинга аргументов командной строки
 import sys  # Модуль для системных функций
 import time  # Модуль для работы со временем
 import ipaddress  # Модуль для работы с IP-адресами
+import json  # Модуль для записи результатов в JSON Lines
+from array import array  # Компактные массивы чисел для хранения результатов
+from itertools import chain, compress  # Склейка потоков и выборка по маске
+import multiprocessing  # Модуль для запуска воркер-процессов
+import queue  # Исключение queue.Empty при ожидании результатов от воркеров
+import random  # Случайная выборка портов для перепроверки
+import os  # Проверка наличия файла контрольной точки
+import signal  # Обработка Ctrl+C в воркер-процессах
+import errno  # Имена кодов ошибок подключения для счетчиков
+import threading  # Фоновая выгрузка метрик
+from bisect import bisect_left, bisect_right  # Корзина гистограммы RTT, поиск диапазона портов
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Метрики по HTTP
+from concurrent.futures import ThreadPoolExecutor  # Параллельное разрешение имен
+import re  # Сигнатуры баннеров сервисов
+import hashlib  # Хеш баннера - ключ кэша определения сервисов
+from collections import OrderedDict, deque  # LRU-кэш определения сервисов, отложенные порты хостов
+
+try:
+    import resource  # Лимиты процесса (нет на Windows)
+except ImportError:
+    resource = None
 
 # Создание словарь с портами и сервисами
 COMMON_PORTS = {
@@ -12,24 +33,675 @@ COMMON_PORTS = {
     443: "HTTPS", 445: "SMB", 993: "IMAPS", 995: "POP3S",
     3306: "MySQL", 3389: "RDP", 5432: "PostgreSQL", 8080: "HTTP Proxy"}
 
+# Сигнатуры баннеров: (регулярное выражение, сервис); группа 1 - версия/подробности
+# Проверяются по порядку, первое совпадение побеждает
+BANNER_SIGNATURES = [(re.compile(pattern), name) for pattern, name in [
+    (rb'^SSH-[\d.]+-([^\r\n]+)', "SSH"),
+    (rb'^HTTP/\d(?:\.\d)? \d{3}[^\r\n]*\r?\n(?:[^\r\n]+\r?\n)*?[Ss]erver: *([^\r\n]+)', "HTTP"),
+    (rb'^HTTP/\d(?:\.\d)? (\d{3})', "HTTP"),
+    (rb'^220[ -]([^\r\n]*(?:SMTP|Postfix|Exim|Sendmail)[^\r\n]*)', "SMTP"),
+    (rb'^220[ -]([^\r\n]*(?:FTP|FileZilla)[^\r\n]*)', "FTP"),
+    (rb'^220[ -]([^\r\n]*)', "FTP/SMTP"),
+    (rb'^\+OK ?([^\r\n]*)', "POP3"),
+    (rb'^\* OK ?([^\r\n]*)', "IMAP"),
+    (rb'(?s)^.{3}\x00\x0a([\x20-\x7e]+)\x00', "MySQL"),
+    (rb'^RFB (\d{3}\.\d{3})', "VNC"),
+    (rb'^\xff[\xfb-\xfe]', "Telnet"),
+    (rb'^\x15\x03[\x00-\x04]', "TLS"),
+]]
+
+# Проба для сервисов, которые молчат, пока клиент не заговорит первым (HTTP и т.п.)
+BANNER_PROBE = b"HEAD / HTTP/1.0\r\n\r\n"
+
+# Статусы портов; индекс в кортеже - код статуса в компактном хранилище результатов
+STATUSES = ("OPEN", "CLOSED", "FILTERED", "ERROR")
+
+# Самые часто открытые порты (по убыванию частоты) - для спецификации "topN"
+TOP_PORTS = [
+    80, 23, 443, 21, 22, 25, 3389, 110, 445, 139, 143, 53, 135, 3306, 8080, 1723, 111, 995, 993, 5900,
+    1025, 587, 8888, 199, 1720, 465, 548, 113, 81, 6001, 10000, 514, 5060, 179, 1026, 2000, 8443, 8000,
+    32768, 554, 26, 1433, 49152, 2001, 515, 8008, 49154, 1027, 5666, 646, 5000, 5631, 631, 49153, 8081,
+    2049, 88, 79, 5800, 106, 2121, 1110, 49155, 6000, 513, 990, 5357, 427, 49156, 543, 544, 5101, 144,
+    7, 389, 8009, 3128, 444, 9999, 5009, 7070, 5190, 3000, 5432, 1900, 3986, 13, 1029, 9, 5051, 6646,
+    49157, 1028, 873, 1755, 2717, 4899, 9100, 119, 37]
+# Порты из COMMON_PORTS, которых нет в таблице, идут в конец
+TOP_PORTS += [port for port in COMMON_PORTS if port not in TOP_PORTS]
+
+# Запас дескрипторов под stdout, файлы результатов и т.п.
+FD_RESERVE = 64
+
+# Сколько строк "имя -> адрес" печатать перед сканированием
+MAX_NAMES_SHOWN = 10
+
+# Максимум адресов в одной CIDR-сети (список целей раскрывается в памяти целиком)
+MAX_NETWORK_ADDRESSES = 2**20
+
+# Поднимаем лимит открытых файлов под нужное число одновременных подключений
+def _raise_fd_limit(wanted):
+    # Возвращает число подключений, которое реально можно держать открытыми
+    if resource is None:  # Нет модуля resource - оставляем как есть
+        return wanted
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)  # Текущие лимиты
+        needed = wanted + FD_RESERVE  # Сколько дескрипторов понадобится
+        if soft != resource.RLIM_INFINITY and soft < needed:
+            new_soft = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (new_soft, hard))  # Поднимаем мягкий лимит
+            soft = new_soft
+        if soft == resource.RLIM_INFINITY:
+            return wanted
+        return max(1, min(wanted, soft - FD_RESERVE))  # Не больше, чем позволяет ОС
+    except (ValueError, OSError):  # Не удалось изменить лимит
+        return wanted
+
+# Набор портов в виде непересекающихся диапазонов
+class PortSet:
+    def __init__(self, ports=()):
+        # ports - любые номера портов; хранятся как отсортированные диапазоны без повторов
+        self.ranges = []  # Список range, по возрастанию, без пересечений
+        for port in sorted(set(ports)):
+            if self.ranges and self.ranges[-1].stop == port:  # Продолжает последний диапазон
+                self.ranges[-1] = range(self.ranges[-1].start, port + 1)
+            else:
+                self.ranges.append(range(port, port + 1))
+
+    # создание набора из спецификации вида "22,80-90,443,top100"
+    @classmethod
+    def from_spec(cls, spec):
+        # Разбирает спецификацию портов, при ошибке - ValueError
+        bounds = []  # Пары (начало, конец) до объединения
+        for part in spec.split(','):
+            part = part.strip().lower()
+            if not part:
+                continue
+            if part.startswith('top'):  # topN - N самых популярных портов
+                count = int(part[3:])
+                if not (1 <= count <= len(TOP_PORTS)):
+                    raise ValueError(f"top поддерживает от 1 до {len(TOP_PORTS)} портов: {part}")
+                bounds.extend((port, port) for port in TOP_PORTS[:count])
+            elif '-' in part:  # Диапазон; "-1024" и "60000-" - открытые границы
+                start, end = part.split('-', 1)
+                bounds.append((int(start) if start else 1, int(end) if end else 65535))
+            else:  # Одиночный порт
+                bounds.append((int(part), int(part)))
+        if not bounds:
+            raise ValueError("не указано ни одного порта")
+        for start, end in bounds:
+            if not (1 <= start <= end <= 65535):
+                raise ValueError(f"некорректный диапазон портов: {start}-{end}")
+        return cls.from_ranges(range(start, end + 1) for start, end in bounds)
+
+    # создание набора из диапазонов (range с шагом 1), пересечения объединяются
+    @classmethod
+    def from_ranges(cls, ranges):
+        port_set = cls()
+        for port_range in sorted((r for r in ranges if len(r)), key=_range_start):
+            last = port_set.ranges[-1] if port_set.ranges else None
+            if last is not None and port_range.start <= last.stop:  # Пересекается или примыкает
+                port_set.ranges[-1] = range(last.start, max(last.stop, port_range.stop))
+            else:
+                port_set.ranges.append(port_range)
+        return port_set
+
+    # набор из range, PortSet или любых портов - без перебора, если это возможно
+    @classmethod
+    def of(cls, ports):
+        if isinstance(ports, cls):
+            return ports
+        if isinstance(ports, range) and ports.step == 1:
+            return cls.from_ranges([ports])
+        return cls(ports)
+
+    # доля набора для одного из count воркеров: каждый count-й порт, начиная с index
+    def stripe(self, index, count):
+        # Доля хранится как range с шагом count - без отдельного диапазона на каждый порт
+        # Это не PortSet (операции над наборами рассчитаны на шаг 1) - только перебор и проверка порта
+        parts = []
+        offset = 0  # Сколько портов в предыдущих диапазонах
+        for port_range in self.ranges:
+            part = port_range[(index - offset) % count::count]
+            if len(part):
+                parts.append(part)
+            offset += len(port_range)
+        return PortStripe(parts)
+
+    # добавление порта с объединением соседних диапазонов
+    def add(self, port):
+        index = bisect_right(_RangeStarts(self.ranges), port)  # Диапазоны до index начинаются не позже
+        before = self.ranges[index - 1] if index else None
+        after = self.ranges[index] if index < len(self.ranges) else None
+        if before is not None and port < before.stop:  # Уже есть
+            return
+        joins_before = before is not None and before.stop == port
+        joins_after = after is not None and after.start == port + 1
+        if joins_before and joins_after:  # Заполняет промежуток между диапазонами
+            self.ranges[index - 1:index + 1] = [range(before.start, after.stop)]
+        elif joins_before:
+            self.ranges[index - 1] = range(before.start, port + 1)
+        elif joins_after:
+            self.ranges[index] = range(port, after.stop)
+        else:
+            self.ranges.insert(index, range(port, port + 1))
+
+    # операции над наборами - по диапазонам, без перебора портов
+    def union(self, *others):
+        return PortSet.from_ranges(chain(self.ranges, *(other.ranges for other in others)))
+
+    def intersection(self, other):
+        result = PortSet()
+        mine, theirs = self.ranges, other.ranges
+        i = j = 0
+        while i < len(mine) and j < len(theirs):
+            start = max(mine[i].start, theirs[j].start)
+            stop = min(mine[i].stop, theirs[j].stop)
+            if start < stop:
+                result.ranges.append(range(start, stop))
+            if mine[i].stop < theirs[j].stop:
+                i += 1
+            else:
+                j += 1
+        return result
+
+    def difference(self, other):
+        result = PortSet()
+        theirs = other.ranges
+        j = 0
+        for port_range in self.ranges:
+            start = port_range.start
+            while j < len(theirs) and theirs[j].stop <= start:  # Вычитаемые диапазоны левее текущего
+                j += 1
+            k = j
+            while k < len(theirs) and theirs[k].start < port_range.stop:  # Вырезаем пересечения
+                if theirs[k].start > start:
+                    result.ranges.append(range(start, theirs[k].start))
+                start = max(start, theirs[k].stop)
+                k += 1
+            if start < port_range.stop:
+                result.ranges.append(range(start, port_range.stop))
+        return result
+
+    def sample(self, count):  # count случайных портов набора
+        offsets = []  # Номер первого порта каждого диапазона в наборе
+        total = 0
+        for port_range in self.ranges:
+            offsets.append(total)
+            total += len(port_range)
+        picked = []
+        for index in random.sample(range(total), count):
+            i = bisect_right(offsets, index) - 1
+            picked.append(self.ranges[i][index - offsets[i]])
+        return PortSet(picked)
+
+    def __iter__(self):  # Порты по возрастанию, без создания списка
+        for port_range in self.ranges:
+            yield from port_range
+
+    def __len__(self):  # Количество портов
+        return sum(len(port_range) for port_range in self.ranges)
+
+    def __contains__(self, port):  # Двоичный поиск диапазона по началу
+        index = bisect_right(_RangeStarts(self.ranges), port) - 1
+        return index >= 0 and port in self.ranges[index]
+
+    def __str__(self):  # Обратно в спецификацию: "22,80-90"
+        return ','.join(str(r.start) if len(r) == 1 else f"{r.start}-{r[-1]}" for r in self.ranges)
+
+    @property
+    def first(self):  # Наименьший порт
+        return self.ranges[0][0]
+
+    @property
+    def last(self):  # Наибольший порт
+        return self.ranges[-1][-1]
+
+# Доля набора портов от PortSet.stripe: диапазоны с шагом, по возрастанию
+class PortStripe:
+    def __init__(self, ranges):
+        self.ranges = ranges  # Список range с одинаковым шагом, без пересечений
+
+    def __iter__(self):  # Порты по возрастанию
+        for port_range in self.ranges:
+            yield from port_range
+
+    def __len__(self):
+        return sum(len(port_range) for port_range in self.ranges)
+
+    def __contains__(self, port):
+        index = bisect_right(_RangeStarts(self.ranges), port) - 1
+        return index >= 0 and port in self.ranges[index]
+
+# Начало диапазона - ключ для сортировки
+def _range_start(port_range):
+    return port_range.start
+
+# Начала диапазонов как последовательность для bisect (key= есть только с Python 3.10)
+class _RangeStarts:
+    def __init__(self, ranges):
+        self.ranges = ranges  # Список range, по возрастанию
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def __getitem__(self, index):
+        return self.ranges[index].start
+
+# Отмена всех незавершенных задач текущего цикла событий
+async def _cancel_pending_tasks():
+    await _cancel_and_wait(task for task in asyncio.all_tasks() if task is not asyncio.current_task())
+
+# Отмена задач с ожиданием их завершения
+async def _cancel_and_wait(tasks):
+    tasks = set(tasks)
+    while tasks:
+        # Отмену повторяем: wait_for может "проглотить" ее, если подключение завершилось в тот же момент
+        for task in tasks:
+            task.cancel()
+        done, tasks = await asyncio.wait(tasks, timeout=0.1)  # Ждем, пока задачи завершатся
+
+# Ограничитель подключений к одному хосту
+class HostLimiter:
+    def __init__(self, max_in_flight=None, rate=None):
+        # max_in_flight - одновременных подключений, rate - новых подключений в секунду
+        self.semaphore = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+        self.interval = 1.0 / rate if rate else 0.0  # Минимальный интервал между подключениями
+        self.next_slot = 0.0  # Время, раньше которого нельзя начинать следующее подключение
+
+    async def acquire(self):  # Место и слот скорости для нового подключения
+        if self.semaphore is not None:
+            await self.semaphore.acquire()  # Ждем свободного места для этого хоста
+        await self.pace()
+
+    async def pace(self):  # Только слот скорости (подключение на уже занятом месте)
+        if self.interval:
+            now = time.monotonic()  # Текущее время
+            wait = self.next_slot - now  # Сколько ждать до своей очереди
+            self.next_slot = max(now, self.next_slot) + self.interval  # Бронируем следующий слот
+            if wait > 0:
+                await asyncio.sleep(wait)  # Ждем своей очереди
+
+    def release(self):
+        if self.semaphore is not None:
+            self.semaphore.release()  # Освобождаем место
+
+    def ready(self):  # Можно начать подключение сразу, без ожидания места или слота
+        return ((self.semaphore is None or not self.semaphore.locked())
+                and time.monotonic() >= self.next_slot)
+
+# Раздача пар (хост, порт) воркерам с учетом лимитов хостов
+class PairScheduler:
+    def __init__(self, pairs, limiter_for, max_deferred=4096):
+        # Пары занятого хоста откладываются, а воркер берет пару другого хоста - медленный хост
+        # не занимает общие места подключений; max_deferred - сколько пар можно отложить
+        self.pairs = iter(pairs)  # Общий итератор пар
+        self.limiter_for = limiter_for  # Ограничитель хоста
+        self.max_deferred = max_deferred
+        self.deferred = {}  # Хост -> порты, ждущие освобождения хоста (по порядку)
+        self.deferred_count = 0  # Всего отложенных портов
+        self.exhausted = False  # Итератор пар закончился
+        self.waiters = deque()  # Future воркеров, ждущих свободного хоста (по очереди)
+
+    def _take(self):  # Пара, которую можно начать сразу, или None
+        for host, ports in self.deferred.items():  # Сначала - отложенные порты освободившихся хостов
+            if self.limiter_for(host).ready():
+                port = ports.popleft()
+                self.deferred_count -= 1
+                if not ports:
+                    del self.deferred[host]
+                return host, port
+        while not self.exhausted and self.deferred_count < self.max_deferred:
+            pair = next(self.pairs, None)
+            if pair is None:
+                self.exhausted = True
+                break
+            host, port = pair
+            if host not in self.deferred and self.limiter_for(host).ready():
+                return pair
+            self.deferred.setdefault(host, deque()).append(port)  # Хост занят - откладываем
+            self.deferred_count += 1
+        return None
+
+    async def next(self):  # Следующая пара или None, если пары закончились
+        while True:
+            pair = self._take()
+            if pair is not None:
+                # Свободных мест могло быть больше одного - будим следующего; тот, кому пары
+                # не хватит, снова уснет, и цепочка остановится
+                self._wake_one()
+                return pair
+            if self.exhausted and not self.deferred:
+                self._wake_all()  # Остальным ждущим тоже пора завершаться
+                return None
+            # Все хосты с парами заняты - ждем завершения подключения или ближайшего слота скорости
+            now = time.monotonic()
+            delays = [limiter.next_slot - now for limiter in map(self.limiter_for, self.deferred)
+                      if limiter.interval]
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, max(0.001, min(delays)) if delays else None)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self):  # Подключение завершилось - место хоста свободно, будим одного воркера
+        self._wake_one()
+
+    def _wake_one(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():  # Future, отмененные по таймауту, пропускаем
+                waiter.set_result(None)
+                return
+
+    def _wake_all(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+# Оценка RTT хоста (как SRTT/RTTVAR в TCP, RFC 6298)
+class RttEstimator:
+    ALPHA = 1 / 8  # Вес нового замера в среднем RTT
+    BETA = 1 / 4  # Вес нового замера в разбросе RTT
+    K = 4  # Сколько разбросов добавлять к среднему
+    MIN_SAMPLES = 3  # До стольких замеров используется максимальный таймаут
+
+    def __init__(self, max_timeout, min_timeout=0.05):
+        self.max_timeout = max_timeout  # Верхняя граница таймаута
+        self.min_timeout = min_timeout  # Нижняя граница таймаута
+        self.srtt = None  # Сглаженное RTT
+        self.rttvar = None  # Разброс RTT
+        self.samples = 0  # Количество замеров
+
+    # новый замер времени ответа
+    def update(self, rtt):
+        if self.srtt is None:  # Первый замер
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.samples += 1
+
+    # текущий таймаут для подключения
+    def timeout(self):
+        if self.samples < self.MIN_SAMPLES:  # Мало данных - не рискуем
+            return self.max_timeout
+        rto = self.srtt + self.K * self.rttvar  # Как RTO в TCP
+        return min(self.max_timeout, max(self.min_timeout, rto))
+
+# Определение сервисов по баннеру на уже открытом соединении
+class BannerGrabber:
+    def __init__(self, timeout=1.0, workers=50, cache_size=4096, cache_ttl=86400.0):
+        # timeout - ожидание ответа сервиса (отдельно от таймаута подключения)
+        # workers - сколько соединений читается одновременно (свой пул, не занимает места подключений)
+        # cache_ttl - сколько секунд запись кэша, прочитанная из файла, считается актуальной
+        self.timeout = timeout  # Таймаут чтения баннера
+        self.workers = workers  # Размер пула чтения баннеров
+        self.cache_size = cache_size  # Максимум записей в кэше
+        self.cache_ttl = cache_ttl
+        # (хост, порт, хеш баннера) -> (сервис, время определения), в порядке использования
+        self.cache = OrderedDict()
+        self.hits = 0  # Сколько раз сервис взят из кэша
+
+    # определение сервиса на открытом сокете
+    async def identify(self, host, port, sock):
+        # Возвращает строку сервиса или None, если сервис не узнан; сокет не закрывает
+        loop = asyncio.get_running_loop()
+        banner = await self._recv(loop, sock)  # Многие сервисы здороваются первыми (SSH, SMTP, FTP)
+        key = (host, port, hashlib.sha1(banner).digest())  # Тот же баннер - тот же сервис
+        if key in self.cache:  # Уже определяли - пробу не отправляем
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return self.cache[key][0]
+
+        response = banner
+        if not banner:  # Сервис молчит - отправляем пробу и читаем ответ
+            try:
+                await asyncio.wait_for(loop.sock_sendall(sock, BANNER_PROBE), self.timeout)
+                response = await self._recv(loop, sock)
+            except (asyncio.TimeoutError, OSError):  # Соединение закрыто или не принимает данные
+                pass
+        service = self.match(response)
+
+        # Ответ молчащего сервиса (HTTP и т.п.) зависит не от баннера: ключ с пустым баннером
+        # у него всегда один и тот же, и кэш выдавал бы старую версию сервиса - не запоминаем
+        if banner:
+            self.remember(key, service)
+        return service
+
+    # запись в кэш, старые записи вытесняются
+    def remember(self, key, service, seen=None):
+        # seen - время определения сервиса (time.time()), по умолчанию - сейчас
+        self.cache[key] = (service, time.time() if seen is None else seen)
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    # кэш между запусками (--banner-cache): JSON Lines, одна запись на (хост, порт, хеш баннера)
+    def load(self, filename):
+        # Записи старше cache_ttl (и записи без времени) пропускаются - сервис мог обновиться
+        oldest = time.time() - self.cache_ttl
+        with open(filename, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    if record.get("seen", 0) < oldest:
+                        continue
+                    key = (record["host"], record["port"], bytes.fromhex(record["banner"]))
+                    self.remember(key, record["service"], record["seen"])
+
+    def save(self, filename):
+        with open(filename, 'w', encoding='utf-8') as f:
+            for (host, port, digest), (service, seen) in self.cache.items():  # От старых к новым
+                record = {"host": host, "port": port, "banner": digest.hex(), "service": service,
+                          "seen": round(seen, 3)}
+                f.write(json.dumps(record) + "\n")
+
+    # записи, определенные в воркер-процессе (-w) - попадают в кэш родителя
+    def merge(self, entries):
+        for key, (service, seen) in entries:
+            self.remember(key, service, seen)
+
+    # чтение ответа не дольше таймаута
+    async def _recv(self, loop, sock):
+        try:
+            return await asyncio.wait_for(loop.sock_recv(sock, 1024), self.timeout)
+        except (asyncio.TimeoutError, OSError):  # Нет ответа или соединение сброшено
+            return b""
+
+    # сопоставление ответа с сигнатурами
+    @staticmethod
+    def match(data):
+        if not data:  # Ответа нет
+            return None
+        for pattern, name in BANNER_SIGNATURES:
+            found = pattern.search(data)
+            if found:
+                detail = found.group(1) if pattern.groups else b""
+                detail = detail.decode('ascii', 'replace').strip()
+                return f"{name} ({detail})"[:50] if detail else name
+        # Неизвестный сервис - первая строка ответа, если она читаемая
+        line = data.split(b"\n", 1)[0].strip()
+        if line and all(32 <= byte < 127 for byte in line):
+            return line.decode('ascii')[:50]
+        return None
+
+# Разрешение имен хостов с кэшем (IPv4 и IPv6 через getaddrinfo)
+class Resolver:
+    def __init__(self, ttl=300.0, negative_ttl=30.0, family=socket.AF_UNSPEC, workers=16):
+        # ttl - сколько хранить адреса, negative_ttl - сколько помнить неразрешимые имена
+        # family - AF_UNSPEC (любые адреса), AF_INET или AF_INET6; workers - размер пула для списков имен
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.family = family
+        self.workers = workers
+        self.cache = {}  # имя -> (момент устаревания, адреса или socket.gaierror)
+        self.lock = threading.Lock()  # Кэш общий для потоков пула
+        self.lookups = 0  # Сколько раз обращались к DNS
+
+    def __getstate__(self):  # Для воркер-процессов (-w): кэш копируется, блокировка - новая
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    # адреса хоста: список (семейство, sockaddr); порт в sockaddr подставляется при подключении
+    def resolve(self, host):
+        # При ошибке - socket.gaierror (неудачи тоже кэшируются)
+        try:
+            address = ipaddress.ip_address(host)  # IP-адрес - без обращения к DNS
+        except ValueError:
+            pass
+        else:
+            family = socket.AF_INET if address.version == 4 else socket.AF_INET6
+            if self.family not in (socket.AF_UNSPEC, family):
+                raise socket.gaierror(socket.EAI_FAMILY, f"адрес {host} другого семейства")
+            return [(family, (host, 0))]
+
+        now = time.monotonic()
+        with self.lock:
+            cached = self.cache.get(host)
+        if cached is not None and cached[0] > now:  # Есть свежая запись
+            result = cached[1]
+        else:
+            with self.lock:
+                self.lookups += 1
+            try:
+                infos = socket.getaddrinfo(host, 0, self.family, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+                result = []  # Без повторов, в порядке предпочтения системы
+                for family, _, _, _, sockaddr in infos:
+                    if (family, sockaddr) not in result:
+                        result.append((family, sockaddr))
+                # IPv4 - первыми, как до поддержки IPv6: система может поставить вперед ::1 или AAAA-запись,
+                # и сервис, слушающий только IPv4, оказался бы закрытым (IPv6 - только с -6)
+                result.sort(key=lambda address: address[0] != socket.AF_INET)
+                expires = now + self.ttl
+            except socket.gaierror as e:
+                result = e
+                expires = now + self.negative_ttl
+            with self.lock:
+                self.cache[host] = (expires, result)
+        if isinstance(result, socket.gaierror):  # Новое исключение - у закэшированного не растет traceback
+            raise socket.gaierror(*result.args)
+        return result
+
+    # параллельное разрешение списка имен
+    def resolve_many(self, hosts):
+        # Возвращает {хост: адреса или socket.gaierror}; IP-адреса и кэш - без пула
+        results = {}
+        pending = []  # Имена, которых нет в кэше
+        now = time.monotonic()
+        for host in dict.fromkeys(hosts):
+            cached = self.cache.get(host)
+            if cached is not None and cached[0] > now:
+                results[host] = cached[1]
+                continue
+            try:
+                ipaddress.ip_address(host)
+            except ValueError:
+                pending.append(host)
+            else:
+                results[host] = self._resolve_or_error(host)
+        if len(pending) == 1:  # Одно имя - без пула потоков
+            results[pending[0]] = self._resolve_or_error(pending[0])
+        elif pending:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(pending))) as pool:
+                results.update(zip(pending, pool.map(self._resolve_or_error, pending)))
+        return results
+
+    def _resolve_or_error(self, host):
+        try:
+            return self.resolve(host)
+        except socket.gaierror as e:
+            return e
+
+# Общий кэш имен для всех сканеров процесса
+DEFAULT_RESOLVER = Resolver()
+
+# Чередование хостов: порт 1 на всех хостах, потом порт 2 и т.д.
+def interleave_targets(hosts, ports, skip=None):
+    # Ни один хост не получает все подключения подряд
+    # skip - {хост: порты}, которые сканировать не нужно (уже известны)
+    for port in ports:
+        for host in hosts:
+            if skip and port in skip.get(host, ()):
+                continue
+            yield host, port
+
+# Разбор списка целей: IP, доменные имена, CIDR-сети и файлы со списками хостов
+def parse_targets(specs, hosts_file=None):
+    # Возвращает список хостов без повторов (порядок сохраняется)
+    entries = []  # Все записи до раскрытия сетей
+    for spec in specs:
+        entries.extend(part.strip() for part in spec.split(','))  # "a,b,c" - несколько целей
+    if hosts_file:  # Файл со списком хостов (по одному в строке, # - комментарий)
+        with open(hosts_file, encoding='utf-8') as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()  # Убираем комментарии
+                entries.extend(line.split())  # В строке может быть несколько целей
+
+    hosts = []  # Итоговый список
+    seen = set()  # Уже добавленные хосты
+    for entry in entries:
+        if not entry:
+            continue
+        if '/' in entry:  # CIDR-сеть
+            network = ipaddress.ip_network(entry, strict=False)  # ValueError при ошибке
+            if network.num_addresses > MAX_NETWORK_ADDRESSES:  # /64 или /8 не раскрываем
+                raise ValueError(f"сеть {entry} слишком большая ({network.num_addresses} адресов, "
+                                 f"максимум {MAX_NETWORK_ADDRESSES}) - разделите ее на части")
+            # Для /32 и /128 hosts() возвращает сам адрес
+            addresses = (str(ip) for ip in network.hosts())
+        else:
+            addresses = (entry,)  # Одиночный IP или доменное имя
+        for address in addresses:
+            if address not in seen:
+                seen.add(address)
+                hosts.append(address)
+    return hosts
+
 # Создание класса для сканирования портов
 class PortScanner:
-    def __init__(self, target_host, timeout=2): 
+    def __init__(self, target_host, timeout=2, adaptive_timeout=True, retries=1, min_timeout=0.05,
+                 banner_grabber=None, metrics=None, resolver=None):
         # Инициализация сканера с целевым хостом, и таймаутом
+        # При adaptive_timeout таймаут подбирается по измеренному RTT хоста, а timeout - верхняя граница
+        # banner_grabber - BannerGrabber: сервисы открытых портов определяются по баннеру
+        # metrics - ScanMetrics: счетчики подключений, гистограмма RTT и коды ошибок
+        # resolver - Resolver: кэш имен (по умолчанию - общий для процесса)
         self.target_host = target_host  # Сохраняем целевой хост
         self.timeout = timeout  # Сохраняем таймаут соединения
-        self.results = []  # Создаем список для хранения результатов
+        self.adaptive_timeout = adaptive_timeout  # Подбирать таймаут по RTT
+        self.retries = retries  # Повторные попытки для портов, не ответивших за короткий таймаут
+        self.min_timeout = min_timeout  # Нижняя граница адаптивного таймаута
+        self.banner_grabber = banner_grabber  # Чтение баннеров (None - выключено)
+        self.metrics = metrics  # Счетчики (None - не собираются)
+        self.resolver = resolver or DEFAULT_RESOLVER  # Разрешение имен с кэшем
+        self.addresses = {}  # Адреса целей текущего сканирования: хост -> (семейство, sockaddr)
+        self.rtt_estimators = {}  # Оценщики RTT по хостам
+        self.results = ResultStore()  # Создаем хранилище результатов (итерируется как список кортежей)
+        self.host_results = {}  # Результаты по хостам при сканировании нескольких целей
         
     # сканирование 1-ого порта
     def scan_single_port(self, port, service_detection=False):
         # Сканирует один порт и после - возвращает результат
+        if self.target_host not in self.addresses:  # Имя разрешается один раз, а не при каждом подключении
+            self.addresses.update(self.resolve_targets([self.target_host]))
+        target = self.addresses[self.target_host]  # (семейство, sockaddr) или ошибка разрешения
         start_time = time.time()  # Засекаем время начала сканирования
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # Создаем TCP сокет
+        family = socket.AF_INET if isinstance(target, socket.gaierror) else target[0]
+        sock = socket.socket(family, socket.SOCK_STREAM)  # Создаем TCP сокет (IPv4 или IPv6)
         sock.settimeout(self.timeout)  # Устанавливаем таймаут для сокета
         
         try:
+            if isinstance(target, socket.gaierror):  # Хост не разрешается
+                raise socket.gaierror(*target.args)
             # Попытка подключиться к порту
-            result = sock.connect_ex((self.target_host, port))  # connect_ex-возвращает код ошибки
+            result = sock.connect_ex((target[1][0], port) + target[1][2:])  # connect_ex-возвращает код ошибки
             response_time = time.time() - start_time  # Определение время отклика
             
             if result == 0:  # 0 - успешное подключение
@@ -57,64 +729,679 @@ class PortScanner:
             
         return (port, status, service, round(response_time, 3))  # Возвращаем результат
     
+    # разрешение целей один раз перед сканированием
+    def resolve_targets(self, hosts):
+        # Возвращает {хост: (семейство, sockaddr) или socket.gaierror}; имена разрешаются параллельно
+        # Из нескольких адресов берется первый (IPv4, если он есть и не задан -6)
+        return {host: result if isinstance(result, socket.gaierror) else result[0]
+                for host, result in self.resolver.resolve_many(hosts).items()}
+
     # определение сервиса по порту
     def get_service_name(self, port):
         # Определение название сервиса по номеру порта
         return COMMON_PORTS.get(port, "Unknown")  # Возвращение сервиса или - Unknown
     
+    # асинхронное сканирование 1-ого порта
+    async def scan_single_port_async(self, port, service_detection=False, host=None):
+        # Неблокирующее подключение к порту внутри цикла событий asyncio
+        result, sock = await self._probe_port(port, service_detection, host)
+        return result
+
+    # проверка порта; сокет открытого порта можно оставить открытым для чтения баннера
+    async def _probe_port(self, port, service_detection=False, host=None, keep_open=False):
+        # Возвращает (результат, сокет); сокет не None, только если keep_open и порт открыт
+        # При адаптивном таймауте порт, не ответивший за короткий таймаут, проверяется повторно
+        host = self.target_host if host is None else host  # По умолчанию - целевой хост сканера
+        estimator = self.get_rtt_estimator(host) if self.adaptive_timeout else None
+        start_time = time.perf_counter()  # Засекаем время начала сканирования
+        attempt = 0  # Номер попытки
+
+        while True:
+            # Таймаут попытки: по измеренному RTT, с удвоением на каждой повторной попытке
+            timeout = self.timeout if estimator is None else min(
+                self.timeout, estimator.timeout() * (2 ** attempt))
+            status, error, sock = await self._connect_async(host, port, timeout, keep_open)
+            # Повторяем, только если таймаут был короче максимального
+            if status != "FILTERED" or timeout >= self.timeout or attempt >= self.retries:
+                break
+            attempt += 1
+
+        response_time = time.perf_counter() - start_time  # Определение время отклика (все попытки)
+        if status == "OPEN":  # Порт-открыт
+            # Если включено определение сервисов-определяем сервис
+            service = self.get_service_name(port) if service_detection else "Unknown"
+        elif status == "ERROR":  # Статус-Ошибка
+            service = error  # Сохраняем сообщение об ошибке
+            response_time = 0.0  # Время отклика 0
+        else:  # CLOSED или FILTERED
+            service = "Unknown"  # - Сервис неизвестен
+
+        return (port, status, service, round(response_time, 3)), sock  # Возвращаем результат
+
+    # одна попытка неблокирующего подключения
+    async def _connect_async(self, host, port, timeout, keep_open=False):
+        # Возвращает (статус, сообщение об ошибке, сокет); RTT ответивших портов уходит в оценщик
+        # При keep_open сокет открытого порта не закрывается - его закрывает вызывающий код
+        loop = asyncio.get_running_loop()  # Текущий цикл событий
+        target = self.addresses.get(host)  # Адрес, разрешенный перед сканированием
+        if target is None:  # Отдельный вызов без ascan - разрешаем через кэш, не блокируя цикл
+            resolved = await loop.run_in_executor(None, self.resolve_targets, [host])
+            target = self.addresses[host] = resolved[host]
+        start_time = time.perf_counter()  # Засекаем время начала попытки
+        sock = None
+        status = None
+        code = None  # Причина неудачи для счетчиков (имя кода ошибки)
+        metrics = self.metrics  # Счетчики (None - не собираются)
+        if metrics is not None:
+            metrics.probe_started()
+
+        try:
+            if isinstance(target, socket.gaierror):  # Хост не разрешается - это ошибка, а не закрытый порт
+                code = "gaierror"
+                return "ERROR", str(target)[:50], None
+            family, sockaddr = target
+            sock = socket.socket(family, socket.SOCK_STREAM)  # Создаем TCP сокет (IPv4 или IPv6)
+            sock.setblocking(False)  # Неблокирующий режим - ожидание берет на себя цикл событий
+            # Попытка подключиться к порту по адресу (без обращения к DNS), не дольше таймаута
+            await asyncio.wait_for(loop.sock_connect(sock, (sockaddr[0], port) + sockaddr[2:]), timeout)
+            status = "OPEN"  # Порт-открыт
+
+        except asyncio.TimeoutError:  # Если истек таймаут
+            code = "timeout"
+            return "FILTERED", None, None  # - Порт фильтруется
+
+        except asyncio.CancelledError:  # Сканирование остановлено
+            code = "cancelled"
+            raise
+
+        except socket.gaierror as e:  # Хост не разрешается - это ошибка, а не закрытый порт
+            code = "gaierror"
+            return "ERROR", str(e)[:50], None
+
+        except OSError as e:  # Код ошибки подключения (как ненулевой ответ connect_ex)
+            code = errno.errorcode.get(e.errno, str(e.errno))  # ECONNREFUSED, EHOSTUNREACH и т.д.
+            if sock is None:  # Не удалось даже создать сокет (например, кончились дескрипторы)
+                return "ERROR", str(e)[:50], None
+            status = "CLOSED"  # - Порт закрыт
+
+        except Exception as e:  # Обработка иных ошибок
+            code = type(e).__name__
+            return "ERROR", str(e)[:50], None
+
+        finally:
+            if sock is not None and not (keep_open and status == "OPEN"):
+                sock.close()  # Закрываем сокет, если он не нужен для чтения баннера
+            if metrics is not None:  # RTT - только для ответивших портов
+                metrics.probe_finished(time.perf_counter() - start_time, status is not None, code)
+
+        if self.adaptive_timeout:  # Хост ответил - уточняем оценку RTT
+            self.get_rtt_estimator(host).update(time.perf_counter() - start_time)
+        return status, None, (sock if status == "OPEN" and keep_open else None)
+
+    # оценщик RTT для хоста
+    def get_rtt_estimator(self, host):
+        # Создается при первом обращении, общий для всех портов хоста
+        if host not in self.rtt_estimators:
+            self.rtt_estimators[host] = RttEstimator(self.timeout, self.min_timeout)
+        return self.rtt_estimators[host]
+
     # сканирование диапазона портов
     def scan_range(self, start_port, end_port, max_threads=100, service_detection=False):
-        # Сканирует диапазон портов с использованием многопоточности
-        self.results = []  # Очищаем предыдущие результаты
-        ports_to_scan = range(start_port, end_port + 1)  # Создание диапазона портов
-        
-        def worker(port):  # Функция-воркер для каждого потока
-            return self.scan_single_port(port, service_detection)  # Сканируем один порт
-        
-        threads = []  # Список для хранения потоков
-        results_lock = threading.Lock()  # Блокировка для безопасного доступа к результатам
-        
-        # Создание и запуск потоков
-        for port in ports_to_scan:
-            thread = threading.Thread(  # Создаем новый поток
-                target=lambda p=port: self._save_result(worker(p), results_lock)  # Функция потока
-                )
-            threads.append(thread)  # Добавляем поток в список
-            thread.start()  # Запуск потока
-            
-            # Ограничение количества одновременно работающих потоков
-            if len(threads) >= max_threads:
-                for t in threads:  # Ждем завершения всех потоков
-                    t.join()  # Блокируем выполнение до завершения потока
-                threads = []  # Очищаем список потоков
-                
-        # Ждем завершения оставшихся потоков
-        for thread in threads:
-            thread.join()  # Блокируем выполнение до завершения потока
-            
+        # Сканирует диапазон портов асинхронно: max_threads - число одновременных подключений
+        return self.scan_ports(range(start_port, end_port + 1), max_threads, service_detection)
+
+    # сканирование произвольного набора портов
+    def scan_ports(self, ports, max_threads=100, service_detection=False):
+        # ports - range, PortSet или список портов; порты перебираются по одному, без копирования
+        self.results = ResultStore()  # Очищаем предыдущие результаты
+        for host, result in self.iter_scan([self.target_host], ports, max_threads, service_detection):
+            self.results.append(result)  # Сохраняем результат
         return self.results  # Возвращаем результаты
-    
-    # сохранение результатов
-    def _save_result(self, result, lock):
-        # Сохраняет результат сканирования безопасно
-        with lock:  # Блокируем доступ к списку результатов
-            self.results.append(result)  # Добавляем результат в список
-            
+
+    # сканирование нескольких хостов
+    def scan_targets(self, hosts, ports, max_threads=100, service_detection=False,
+                     per_host_limit=None, per_host_rate=None):
+        # Сканирует порты (range, PortSet или список) на нескольких хостах с общим лимитом подключений
+        hosts = list(hosts)  # Список хостов нужен несколько раз
+        results = {host: ResultStore() for host in hosts}  # Результаты по каждому хосту
+        for host, result in self.iter_scan(hosts, ports, max_threads, service_detection,
+                                           per_host_limit, per_host_rate):
+            results[host].append(result)  # Сохраняем результат
+        self.host_results = results  # Сохраняем результаты по хостам
+        return results  # Возвращаем результаты
+
+    # потоковое сканирование: результаты выдаются по мере готовности
+    def iter_scan(self, hosts, ports, max_threads=100, service_detection=False,
+                  per_host_limit=None, per_host_rate=None, skip=None):
+        # Генератор пар (хост, результат); ничего не накапливает в памяти
+        # skip - {хост: порты}, которые пропускаются (например, уже есть в контрольной точке)
+        loop = asyncio.new_event_loop()  # Собственный цикл событий для генератора
+        agen = self.ascan(hosts, ports, max_threads, service_detection, per_host_limit, per_host_rate, skip)
+        interrupted = False  # Был ли Ctrl+C
+
+        def on_interrupt():  # Ctrl+C внутри цикла событий - аккуратно отменяем задачи
+            nonlocal interrupted
+            interrupted = True
+            for task in asyncio.all_tasks(loop):
+                task.cancel()
+
+        # Ctrl+C перехватываем, только если его обработка стандартная: воркер-процессы (-w)
+        # игнорируют SIGINT, и этот выбор не должен перекрываться
+        handle_interrupt = signal.getsignal(signal.SIGINT) is signal.default_int_handler
+        if handle_interrupt:
+            try:
+                loop.add_signal_handler(signal.SIGINT, on_interrupt)
+            except (NotImplementedError, RuntimeError, ValueError):  # Windows или не главный поток
+                handle_interrupt = False
+        try:
+            while True:
+                try:
+                    item = loop.run_until_complete(agen.__anext__())  # Ждем следующий результат
+                except StopAsyncIteration:  # Все пары просканированы
+                    break
+                except asyncio.CancelledError:
+                    if interrupted:  # Отмена из-за Ctrl+C - для вызывающего кода это KeyboardInterrupt
+                        raise KeyboardInterrupt from None
+                    raise
+                if interrupted:  # Ctrl+C пришел, когда результат уже был готов
+                    raise KeyboardInterrupt
+                yield item
+        finally:
+            # Прерывание (Ctrl+C или закрытие генератора) - отменяем незавершенные подключения
+            if handle_interrupt:
+                loop.remove_signal_handler(signal.SIGINT)
+            loop.run_until_complete(_cancel_pending_tasks())
+            loop.run_until_complete(agen.aclose())
+            loop.close()
+
+    # параллельное сканирование в нескольких процессах
+    def iter_scan_sharded(self, hosts, ports, workers, max_threads=100, service_detection=False,
+                          per_host_limit=None, per_host_rate=None, skip=None, batch_size=1024):
+        # Делит пары (хост, порт) между workers процессами, в каждом - свой асинхронный движок
+        # Результаты приходят пачками (ResultStore) и выдаются как у iter_scan: пары (хост, результат)
+        hosts = list(hosts)
+        # Лимиты делятся между процессами без округления вверх, поэтому процессов не больше,
+        # чем мест: у каждого хотя бы одно подключение, а в сумме - не больше -t и лимита хоста
+        workers = max(1, min(workers, max_threads))
+        if len(hosts) < workers and per_host_limit:  # Порты хоста делятся - лимит хоста тоже
+            workers = min(workers, per_host_limit)
+        ctx = multiprocessing.get_context()
+        results_queue = ctx.Queue()  # Очередь пачек от всех воркеров
+        # Имена разрешаются здесь один раз - воркеры получают копию кэша
+        self.resolver.resolve_many(hosts)
+        # У каждого воркера свои счетчики того же класса - они приходят вместе с пачками и суммируются здесь
+        scanner_options = (self.timeout, self.adaptive_timeout, self.retries, self.min_timeout,
+                           self.banner_grabber, type(self.metrics)() if self.metrics is not None else None,
+                           self.resolver)
+        processes = [
+            ctx.Process(target=_shard_worker, daemon=True, args=(
+                shard, workers, hosts, ports, scanner_options, _share(max_threads, shard, workers),
+                service_detection, per_host_limit, per_host_rate, skip, batch_size, results_queue))
+            for shard in range(workers)]
+        for process in processes:
+            process.start()
+
+        running = workers  # Сколько воркеров еще не закончили
+        try:
+            while running:
+                try:
+                    message = results_queue.get(timeout=0.5)  # Следующая пачка
+                except queue.Empty:
+                    if any(process.is_alive() for process in processes):
+                        continue
+                    try:  # Воркеры могли успеть отправить последние пачки и "done" и завершиться
+                        message = results_queue.get_nowait()
+                    except queue.Empty:  # Очередь пуста, а "done" пришли не от всех - воркеры упали молча
+                        raise RuntimeError("воркер-процессы завершились без результата")
+                kind, payload = message
+                if kind == "batch":  # (хост, ResultStore)
+                    host, store = payload
+                    for result in store:
+                        yield host, result
+                elif kind == "metrics":  # (номер воркера, счетчики)
+                    if self.metrics is not None:
+                        self.metrics.merge(*payload)
+                elif kind == "banners":  # [(ключ, сервис)] из кэша воркера
+                    self.banner_grabber.merge(payload)
+                elif kind == "error":  # Ошибка в воркере
+                    raise RuntimeError(f"ошибка в воркер-процессе: {payload}")
+                else:  # "done"
+                    running -= 1
+        finally:
+            # Нормальное завершение, Ctrl+C или ошибка - останавливаем все воркеры
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for process in processes:
+                process.join()
+            results_queue.close()
+
+    # асинхронный итератор результатов
+    async def ascan(self, hosts, ports, max_threads=100, service_detection=False,
+                    per_host_limit=None, per_host_rate=None, skip=None):
+        # Выдает пары (хост, результат) по мере готовности
+        # per_host_limit - максимум одновременных подключений к одному хосту
+        # per_host_rate - максимум новых подключений к одному хосту в секунду
+        hosts = list(hosts)  # Список хостов нужен несколько раз
+        total = len(hosts) * len(ports)  # Всего пар (хост, порт)
+        # Имена разрешаются один раз и параллельно; подключения идут уже по адресам
+        self.addresses = await asyncio.get_running_loop().run_in_executor(None, self.resolve_targets, hosts)
+        # Не больше, чем позволяет ОС; соединения в пуле баннеров тоже занимают дескрипторы
+        banner_fds = 2 * self.banner_grabber.workers if self.banner_grabber else 0
+        concurrency = max(1, _raise_fd_limit(min(max_threads, total) + banner_fds) - banner_fds)
+        queue = asyncio.Queue(maxsize=2 * max(1, concurrency))  # Очередь готовых результатов
+        finished = object()  # Признак окончания сканирования
+        limiters = {}  # Ограничители для каждого хоста
+
+        def limiter_for(host):  # Ограничитель для хоста
+            if host not in limiters:
+                limiters[host] = HostLimiter(per_host_limit, per_host_rate)
+            return limiters[host]
+
+        pairs = interleave_targets(hosts, ports, skip)  # Генератор пар - закрывается при остановке
+
+        async def produce():  # Сканирование в фоне, результаты - в очередь
+            try:
+                await self._scan_pairs_async(
+                    pairs, concurrency, service_detection,
+                    lambda host, result: queue.put((host, result)),
+                    limiter_for if (per_host_limit or per_host_rate) else None)
+            except Exception as e:  # Ошибку передаем потребителю
+                await queue.put(e)
+            else:
+                await queue.put(finished)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                item = await queue.get()  # Следующий готовый результат
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Если потребитель остановился раньше - останавливаем сканирование:
+            # новых пар воркеры больше не получат, текущие подключения отменяются
+            pairs.close()
+            await _cancel_and_wait([producer])
+
+    # асинхронный движок со "скользящим окном"
+    async def _scan_pairs_async(self, pairs, concurrency, service_detection, on_result, limiter_for=None):
+        # concurrency воркеров берут пары (хост, порт) из общего итератора: как только одно
+        # подключение завершилось, сразу начинается следующее (без ожидания всей пачки)
+        # on_result(host, result) - корутина-получатель результата
+        # Открытые порты при чтении баннеров уходят в отдельный пул и не занимают места подключений,
+        # но место хоста (лимит на хост) остается занятым до конца чтения баннера
+        # При лимитах на хост пары занятых хостов откладываются, чтобы воркер не простаивал
+        pairs_iter = iter(pairs)  # Общий итератор для всех воркеров
+        scheduler = None if limiter_for is None else PairScheduler(
+            pairs_iter, limiter_for, max(4096, 16 * concurrency))
+        grabber = self.banner_grabber
+        banner_queue = asyncio.Queue() if grabber else None  # (хост, результат, сокет или None)
+
+        async def worker():  # Воркер - одно "место" в окне одновременных подключений
+            while True:
+                # Берем следующую свободную пару
+                pair = next(pairs_iter, None) if scheduler is None else await scheduler.next()
+                if pair is None:  # Пары закончились
+                    return
+                host, port = pair
+                if scheduler is None:
+                    result, sock = await self._probe_port(port, service_detection, host, grabber is not None)
+                else:
+                    limiter = limiter_for(host)
+                    await limiter.acquire()  # Хост свободен - лимиты соблюдены без ожидания
+                    sock = None
+                    try:
+                        result, sock = await self._probe_port(port, service_detection, host,
+                                                              grabber is not None)
+                    finally:
+                        if sock is None:  # Соединение для баннера держит место хоста до чтения
+                            limiter.release()
+                            scheduler.release()  # Место у хоста освободилось
+                if sock is None:
+                    await on_result(host, result)  # Передаем результат дальше
+                    continue
+                # Воркер не ждет чтения баннера; если пул баннеров занят, соединение не держим -
+                # пул переподключится сам, когда освободится
+                if banner_queue.qsize() >= grabber.workers:
+                    sock.close()
+                    sock = None
+                banner_queue.put_nowait((host, result, sock))
+
+        async def banner_worker():  # Чтение баннеров открытых портов
+            while True:
+                host, (port, status, service, resp_time), sock = await banner_queue.get()
+                try:
+                    try:
+                        if sock is None:  # Соединение было закрыто - подключаемся заново
+                            if scheduler is not None:  # Место хоста уже занято - ждем только слот скорости
+                                await limiter_for(host).pace()
+                            sock = (await self._connect_async(host, port, self.timeout, keep_open=True))[2]
+                        if sock is not None:
+                            service = await grabber.identify(host, port, sock) or self.get_service_name(port)
+                    finally:
+                        if sock is not None:
+                            sock.close()
+                        if scheduler is not None:  # Место хоста, занятое воркером подключений, свободно
+                            limiter_for(host).release()
+                            scheduler.release()
+                    await on_result(host, (port, status, service, resp_time))
+                finally:
+                    banner_queue.task_done()  # Результат передан - задача выполнена
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+        banner_tasks = []  # Пул чтения баннеров, затем - задача ожидания, пока он все прочитает
+        if grabber:
+            banner_tasks = [asyncio.create_task(banner_worker()) for _ in range(grabber.workers)]
+        try:
+            await asyncio.gather(*workers)  # Ждем, пока пары не закончатся
+            if banner_tasks:
+                # Ждем чтения оставшихся баннеров; упавший воркер баннеров прерывает ожидание
+                banner_tasks.append(asyncio.create_task(banner_queue.join()))
+                done, pending = await asyncio.wait(banner_tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()  # Пробрасываем ошибку воркера баннеров
+        finally:
+            for task in workers + banner_tasks:  # При ошибке или отмене останавливаем остальных
+                task.cancel()
+            while banner_queue is not None and not banner_queue.empty():  # Непрочитанные соединения
+                host, result, sock = banner_queue.get_nowait()
+                if sock is not None:
+                    sock.close()
+                if scheduler is not None:
+                    limiter_for(host).release()
+
     # сортировка результатов по порту
     def sort_results_by_port(self, descending=False):
         # Сортирует результаты по номеру порта
         self.results.sort(key=lambda x: x[0], reverse=descending)  # Сортировка по первому элементу (порту)
         return self.results  # Возвращаем отсортированные результаты
 
+# Доля лимита total для процесса shard из shards: доли отличаются не больше чем на 1, сумма - total
+def _share(total, shard, shards):
+    return total // shards + (shard < total % shards)
+
+# Воркер-процесс для iter_scan_sharded: сканирует свою долю и отправляет результаты пачками
+def _shard_worker(shard, shards, hosts, ports, scanner_options, max_threads, service_detection,
+                  per_host_limit, per_host_rate, skip, batch_size, results_queue):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C обрабатывает родительский процесс
+    try:
+        if len(hosts) >= shards:  # Хостов хватает - каждый процесс берет свои хосты целиком
+            hosts = hosts[shard::shards]
+        else:  # Хостов мало - делим порты, а лимиты на хост - между процессами
+            ports = PortSet.of(ports).stripe(shard, shards)
+            per_host_limit = per_host_limit and _share(per_host_limit, shard, shards)
+            per_host_rate = per_host_rate and per_host_rate / shards
+
+        if hosts and len(ports):
+            scanner = PortScanner(hosts[0], *scanner_options)
+            batches = {}  # Неотправленные результаты по хостам
+            pending = 0  # Сколько результатов ждут отправки
+            last_flush = time.monotonic()  # Время последней отправки
+            for host, result in scanner.iter_scan(hosts, ports, max_threads, service_detection,
+                                                  per_host_limit, per_host_rate, skip):
+                batches.setdefault(host, ResultStore()).append(result)
+                pending += 1
+                # Отправляем при наборе пачки или раз в полсекунды, чтобы вывод не замирал
+                if pending >= batch_size or time.monotonic() - last_flush > 0.5:
+                    for batch in batches.items():
+                        results_queue.put(("batch", batch))
+                    if scanner.metrics is not None:  # Счетчики - вместе с пачками
+                        results_queue.put(("metrics", (shard, scanner.metrics.counters())))
+                    batches, pending, last_flush = {}, 0, time.monotonic()
+            for batch in batches.items():  # Остаток
+                results_queue.put(("batch", batch))
+            if scanner.metrics is not None:
+                results_queue.put(("metrics", (shard, scanner.metrics.counters())))
+            if scanner.banner_grabber is not None:  # Кэш баннеров - родителю (для --banner-cache)
+                results_queue.put(("banners", list(scanner.banner_grabber.cache.items())))
+        results_queue.put(("done", shard))
+    except Exception as e:  # Ошибку передаем родителю
+        results_queue.put(("error", str(e)))
+
+# Счетчики результатов - считаются по ходу сканирования, без повторных проходов
+class ScanStats:
+    def __init__(self):
+        self.total = 0  # Всего портов
+        self.counts = {"OPEN": 0, "CLOSED": 0, "FILTERED": 0, "ERROR": 0}  # По статусам
+
+    def add(self, status):  # Учесть один результат
+        self.total += 1
+        self.counts[status] = self.counts.get(status, 0) + 1
+
+    @classmethod
+    def from_results(cls, results):  # Счетчики для готового списка за один проход
+        if isinstance(results, ResultStore):  # Хранилище считает само, без перебора кортежей
+            return results.stats()
+        stats = cls()
+        for result in results:
+            stats.add(result[1])
+        return stats
+
+    def summary(self):  # Строка статистики
+        return (f"Всего: {self.total} | Открыто: {self.counts['OPEN']} | "
+                f"Закрыто: {self.counts['CLOSED']} | Фильтруется: {self.counts['FILTERED']}")
+
+# Метрики сканирования: подключения в работе, скорость, гистограмма RTT, коды ошибок
+# Обновляются парой сложений на подключение - можно не выключать на больших сканированиях
+class ScanMetrics:
+    RTT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)  # Границы, сек
+
+    def __init__(self, total=None):
+        self.total = total  # Сколько пар (хост, порт) ожидается (None - неизвестно)
+        self.started = time.monotonic()  # Время начала
+        self.in_flight = 0  # Открытых подключений сейчас
+        self.probes = 0  # Завершенных попыток подключения (включая повторные)
+        self.results = 0  # Полученных результатов
+        self.statuses = {status: 0 for status in STATUSES}  # Результаты по статусам
+        self.errors = {}  # Код ошибки подключения -> количество
+        self.rtt_buckets = [0] * (len(self.RTT_BUCKETS) + 1)  # Последняя корзина - больше всех границ
+        self.rtt_sum = 0.0  # Сумма RTT, сек
+        self.shards = {}  # Счетчики воркер-процессов (-w): номер -> counters()
+
+    # хуки сканера
+    def probe_started(self):
+        self.in_flight += 1
+
+    def probe_finished(self, elapsed, answered=True, code=None):
+        # elapsed - длительность попытки без округления, answered - хост ответил (в гистограмму RTT),
+        # code - причина неудачи
+        self.in_flight -= 1
+        self.probes += 1
+        if answered:
+            self.rtt_buckets[bisect_left(self.RTT_BUCKETS, elapsed)] += 1
+            self.rtt_sum += elapsed
+        if code is not None:
+            self.errors[code] = self.errors.get(code, 0) + 1
+
+    def add_result(self, status):  # Результат дошел до получателя
+        self.results += 1
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    # счетчики подключений этого процесса (для передачи из воркера)
+    def counters(self):
+        return {"in_flight": self.in_flight, "probes": self.probes, "errors": dict(self.errors),
+                "rtt_buckets": list(self.rtt_buckets), "rtt_sum": self.rtt_sum}
+
+    def merge(self, shard, counters):  # Последние счетчики воркер-процесса
+        self.shards[shard] = counters
+
+    # сводка на текущий момент
+    def snapshot(self):
+        totals = self.counters()
+        for counters in list(self.shards.values()):  # Складываем счетчики воркеров
+            totals["in_flight"] += counters["in_flight"]
+            totals["probes"] += counters["probes"]
+            totals["rtt_sum"] += counters["rtt_sum"]
+            for code, count in counters["errors"].items():
+                totals["errors"][code] = totals["errors"].get(code, 0) + count
+            totals["rtt_buckets"] = [a + b for a, b in zip(totals["rtt_buckets"], counters["rtt_buckets"])]
+
+        elapsed = time.monotonic() - self.started
+        rate = self.results / elapsed if elapsed > 0 else 0.0  # Результатов в секунду
+        eta = None  # Оценка оставшегося времени, сек
+        if self.total and rate > 0:
+            eta = max(0.0, (self.total - self.results) / rate)
+        totals.update({
+            "elapsed": round(elapsed, 3),
+            "total": self.total,
+            "results": self.results,
+            "statuses": dict(self.statuses),
+            "probes_per_sec": round(totals["probes"] / elapsed, 1) if elapsed > 0 else 0.0,
+            "results_per_sec": round(rate, 1),
+            "eta": None if eta is None else round(eta, 1),
+            "rtt_sum": round(totals["rtt_sum"], 6),
+        })
+        return totals
+
+    # метрики в текстовом формате Prometheus
+    def to_prometheus(self, snapshot=None):
+        snapshot = snapshot or self.snapshot()
+        lines = [
+            "# TYPE portscan_in_flight gauge",
+            f"portscan_in_flight {snapshot['in_flight']}",
+            "# TYPE portscan_probes_total counter",
+            f"portscan_probes_total {snapshot['probes']}",
+            "# TYPE portscan_results_total counter",
+        ]
+        lines += [f'portscan_results_total{{status="{status}"}} {count}'
+                  for status, count in snapshot["statuses"].items()]
+        lines.append("# TYPE portscan_probe_errors_total counter")
+        lines += [f'portscan_probe_errors_total{{code="{code}"}} {count}'
+                  for code, count in sorted(snapshot["errors"].items())]
+        lines.append("# TYPE portscan_rtt_seconds histogram")
+        cumulative = 0  # Корзины Prometheus - накопительные
+        for bound, count in zip(self.RTT_BUCKETS + ("+Inf",), snapshot["rtt_buckets"]):
+            cumulative += count
+            lines.append(f'portscan_rtt_seconds_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"portscan_rtt_seconds_sum {snapshot['rtt_sum']}")
+        lines.append(f"portscan_rtt_seconds_count {cumulative}")
+        if snapshot["total"]:
+            lines += ["# TYPE portscan_targets_total gauge", f"portscan_targets_total {snapshot['total']}"]
+        return "\n".join(lines) + "\n"
+
+    # строка прогресса
+    def progress_line(self):
+        snapshot = self.snapshot()
+        eta = snapshot["eta"]
+        eta = "--:--" if eta is None else f"{int(eta) // 60:02d}:{int(eta) % 60:02d}"
+        done = f"{snapshot['results']}/{snapshot['total']}" if snapshot["total"] else str(snapshot["results"])
+        percent = f"{snapshot['results'] / snapshot['total']:6.1%} " if snapshot["total"] else ""
+        return (f"{percent}{done} | {snapshot['results_per_sec']:.0f} портов/сек | "
+                f"в работе: {snapshot['in_flight']} | осталось: {eta}")
+
+# Компактное хранилище результатов: по массиву на каждое поле вместо списка кортежей
+class ResultStore:
+    __slots__ = ("ports", "statuses", "services", "rtts", "service_names", "service_index")
+
+    def __init__(self, results=()):
+        self.ports = array('H')  # Номера портов (uint16)
+        self.statuses = array('B')  # Коды статусов (индекс в STATUSES)
+        self.services = array('H')  # Индексы в таблице названий сервисов
+        self.rtts = array('f')  # Время отклика (float32)
+        self.service_names = []  # Таблица названий сервисов (каждое хранится один раз)
+        self.service_index = {}  # Название -> индекс в таблице
+        self.extend(results)
+
+    # добавление результата-кортежа (порт, статус, сервис, время)
+    def append(self, result):
+        port, status, service, resp_time = result
+        index = self.service_index.get(service)
+        if index is None:  # Новое название - добавляем в таблицу
+            index = self.service_index[service] = len(self.service_names)
+            self.service_names.append(service)
+            if index > 0xFFFF and self.services.typecode == 'H':  # Не помещается в uint16
+                self.services = array('I', self.services)
+        self.ports.append(port)
+        self.statuses.append(STATUSES.index(status))
+        self.services.append(index)
+        self.rtts.append(resp_time)
+
+    def extend(self, results):
+        for result in results:
+            self.append(result)
+
+    def __len__(self):
+        return len(self.ports)
+
+    def __getitem__(self, i):  # Кортеж (порт, статус, сервис, время) - как раньше; срез - новое хранилище
+        if isinstance(i, slice):
+            return self._copy(self.ports[i], self.statuses[i], self.services[i], self.rtts[i])
+        return (self.ports[i], STATUSES[self.statuses[i]],
+                self.service_names[self.services[i]], round(self.rtts[i], 3))
+
+    def __eq__(self, other):  # Сравнение как у списка кортежей (с ResultStore или list)
+        if isinstance(other, (ResultStore, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"ResultStore({list(self)!r})"
+
+    def __iter__(self):
+        names = self.service_names
+        for port, status, service, rtt in zip(self.ports, self.statuses, self.services, self.rtts):
+            yield (port, STATUSES[status], names[service], round(rtt, 3))
+
+    def tuples(self):  # Список кортежей для старого кода
+        return list(self)
+
+    # подсчет по статусу без создания кортежей
+    def count(self, status):
+        return self.statuses.tobytes().count(STATUSES.index(status))
+
+    def stats(self):  # Счетчики по всем статусам
+        stats = ScanStats()
+        raw = self.statuses.tobytes()
+        stats.total = len(raw)
+        stats.counts = {status: raw.count(code) for code, status in enumerate(STATUSES)}
+        return stats
+
+    # выборка результатов с заданным статусом
+    def filter(self, status):
+        code = STATUSES.index(status)
+        table = bytes(1 if c == code else 0 for c in range(256))  # Код статуса -> 1, остальные -> 0
+        return self._take_mask(self.statuses.tobytes().translate(table))  # Маска строится в C
+
+    # сортировка по порту на месте
+    def sort(self, key=None, reverse=False):
+        # key - как у list.sort (получает кортеж); по умолчанию - по порту
+        if key is None:
+            order = sorted(range(len(self)), key=self.ports.__getitem__, reverse=reverse)
+        else:
+            order = sorted(range(len(self)), key=lambda i: key(self[i]), reverse=reverse)
+        self.ports = array('H', (self.ports[i] for i in order))
+        self.statuses = array('B', (self.statuses[i] for i in order))
+        self.services = array(self.services.typecode, (self.services[i] for i in order))
+        self.rtts = array('f', (self.rtts[i] for i in order))
+
+    def sorted_by_port(self, descending=False):  # Отсортированная копия
+        copy = self._take_mask(b"\x01" * len(self))
+        copy.sort(reverse=descending)
+        return copy
+
+    def _take_mask(self, mask):  # Новое хранилище из элементов по маске
+        return self._copy(array('H', compress(self.ports, mask)), array('B', compress(self.statuses, mask)),
+                          array(self.services.typecode, compress(self.services, mask)),
+                          array('f', compress(self.rtts, mask)))
+
+    def _copy(self, ports, statuses, services, rtts):  # Хранилище из готовых массивов
+        # Таблица сервисов копируется: добавление в копию не меняет исходное хранилище
+        store = ResultStore()
+        store.ports, store.statuses, store.services, store.rtts = ports, statuses, services, rtts
+        store.service_names = list(self.service_names)
+        store.service_index = dict(self.service_index)
+        return store
+
 # Функция для валидации входных данных
-def validate_input(host, start_port, end_port):
+def validate_input(host, start_port, end_port, resolver=None):
     # Проверяет корректность входных параметров
+    # resolver - кэш имен: разрешенный здесь адрес потом используется при сканировании
     try:
-        # является ли host валидным IP или доменным именем?
-        try:
-            ipaddress.ip_address(host)  # является ли host IP-адресом?
-        except ValueError:
-            socket.gethostbyname(host)  # Пробуем разрешить доменное имя
+        # является ли host валидным IP или доменным именем? (IPv4 и IPv6)
+        (resolver or DEFAULT_RESOLVER).resolve(host)
             
         # Проверяем корректность портов
         if not (1 <= start_port <= 65535):  # начальный порт
@@ -132,23 +1419,30 @@ def validate_input(host, start_port, end_port):
         return False, f"Ошибка валидации: {str(e)}"
     
 # вывод результатов
-def display_results(results, show_all=False, sort_descending=False):
-    # Выводит результаты сканирования
+def display_results(results, show_all=False, sort_descending=False, stats=None):
+    # Выводит результаты сканирования (stats - готовые счетчики, если результаты собраны не все)
     print("\n" + "="*60)  # Обычная разделительная линия(для красоты)
     print("РЕЗУЛЬТАТЫ СКАНИРОВАНИЯ ПОРТОВ")  # Заголовок
     print("="*60)  # Обычная разделительная линия(для красоты)
     
     # Сортировка результатов по порту (от большего к меньшему если sort_descending=True)
-    if sort_descending:
+    if isinstance(results, ResultStore):
+        results.sort(reverse=sort_descending)  # По порту без создания кортежей
+    elif sort_descending:
         results.sort(key=lambda x: x[0], reverse=True)
     else:
         results.sort(key=lambda x: x[0])
     
     # Фильтруем открытые порты
-    open_ports = [r for r in results if r[1] == "OPEN"]
+    if isinstance(results, ResultStore):
+        open_ports = results.filter("OPEN")  # Без перебора кортежей
+    else:
+        open_ports = [r for r in results if r[1] == "OPEN"]
+    if stats is None:  # Счетчиков нет - считаем за один проход
+        stats = ScanStats.from_results(results)
     
     if show_all:  # показать все порты
-        print(f"\nВсего просканировано портов: {len(results)}")  # Общее количество отсканированных портов
+        print(f"\nВсего просканировано портов: {stats.total}")  # Общее количество отсканированных портов
         print("-"*60)  # Обычная разделительная линия(для красоты)
         for port, status, service, resp_time in results:  # Перебираем все результаты
             color = "\033[92m" if status == "OPEN" else "\033[91m"  # Выбираем цвет текста
@@ -169,137 +1463,641 @@ def display_results(results, show_all=False, sort_descending=False):
     # статистика-вывод
     print("\n" + "-"*60)  # Обычная разделительная линия(для красоты)
     print("СТАТИСТИКА:") 
-    total = len(results)  # Всего портов?
-    open_count = len(open_ports)  # Открытых портов?
-    closed_count = len([r for r in results if r[1] == "CLOSED"])  # Закрытых портов?
-    filtered_count = len([r for r in results if r[1] == "FILTERED"])  # Фильтруемых портов?
-    print(f"Всего: {total} | Открыто: {open_count} | "
-          f"Закрыто: {closed_count} | Фильтруется: {filtered_count}")  # Общая статистика - вывод
+    print(stats.summary())  # Общая статистика - вывод
 
 # сохранение результатов в файл
-def save_results_to_file(filename, results, host):
-    # Сохраняет результаты сканирования в файл
+def save_results_to_file(filename, results, host, append=False, stats=None):
+    # Сохраняет результаты сканирования в файл (append=True - дописать в конец, для нескольких хостов)
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
+        with open(filename, 'a' if append else 'w', encoding='utf-8') as f:
+            if append:
+                f.write("\n")  # Отделяем хосты друг от друга
             f.write(f"Результаты сканирования портов для хоста: {host}\n")
             f.write(f"Время сканирования: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
             f.write("="*60 + "\n")
             
             # Сортировка по порту (от большего к меньшему)
-            sorted_results = sorted(results, key=lambda x: x[0], reverse=True)
+            if isinstance(results, ResultStore):
+                sorted_results = results.sorted_by_port(descending=True)
+            else:
+                sorted_results = sorted(results, key=lambda x: x[0], reverse=True)
             
             for port, status, service, resp_time in sorted_results:
                 f.write(f"Порт {port:5d}: {status:10s} | Сервис: {service:15s} | "
                        f"Время: {resp_time:5.3f} сек\n")
                 
             # Статистика
-            open_ports = [r for r in results if r[1] == "OPEN"]
-            total = len(results)
-            open_count = len(open_ports)
-            closed_count = len([r for r in results if r[1] == "CLOSED"])
-            filtered_count = len([r for r in results if r[1] == "FILTERED"])
+            if stats is None:  # Счетчиков нет - считаем за один проход
+                stats = ScanStats.from_results(results)
             
             f.write("\n" + "="*60 + "\n")
             f.write("СТАТИСТИКА:\n")
-            f.write(f"Всего: {total} | Открыто: {open_count} | "
-                   f"Закрыто: {closed_count} | Фильтруется: {filtered_count}\n")
+            f.write(stats.summary() + "\n")
             
-        print(f"\nРезультаты сохранены в файл: {filename}")
+        if not append:
+            print(f"\nРезультаты сохранены в файл: {filename}")
         return True
     except Exception as e:
         print(f"Ошибка при сохранении в файл: {str(e)}")
         return False
 
+# Приемники потока результатов: write(хост, результат) и close(общая статистика)
+
+# вывод на экран по мере поступления
+class ConsoleSink:
+    def __init__(self, show_all=False, show_host=False):
+        self.show_all = show_all  # Показывать все порты, а не только открытые
+        self.show_host = show_host  # Подписывать хост (при нескольких целях)
+
+    def write(self, host, result):
+        port, status, service, resp_time = result
+        if status != "OPEN" and not self.show_all:  # Только открытые порты
+            return
+        color = "\033[92m" if status == "OPEN" else "\033[91m"  # Выбираем цвет текста
+        prefix = f"{host} " if self.show_host else ""  # Хост перед портом
+        print(f"{color}{prefix}Порт {port:5d}: {status:10s} | Сервис: {service:15s} | "
+              f"Время: {resp_time:5.3f} сек\033[0m", flush=True)  # Вывод результата сразу
+
+    def close(self, stats):
+        pass
+
+# запись в текстовый файл по мере поступления
+class TextFileSink:
+    def __init__(self, filename, targets):
+        self.filename = filename  # Имя файла
+        self.file = open(filename, 'w', encoding='utf-8')  # Файл открыт на все время сканирования
+        self.file.write(f"Результаты сканирования портов для: {targets}\n")
+        self.file.write(f"Время сканирования: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+        self.file.write("="*60 + "\n")
+
+    def write(self, host, result):
+        port, status, service, resp_time = result
+        self.file.write(f"{host} Порт {port:5d}: {status:10s} | Сервис: {service:15s} | "
+                        f"Время: {resp_time:5.3f} сек\n")
+
+    def close(self, stats):
+        self.file.write("\n" + "="*60 + "\n")
+        self.file.write("СТАТИСТИКА:\n")
+        self.file.write(stats.summary() + "\n")
+        self.file.close()
+        print(f"\nРезультаты сохранены в файл: {self.filename}")
+
+# запись в JSON Lines - одна строка на результат
+class JsonLinesSink:
+    def __init__(self, filename):
+        self.filename = filename  # Имя файла
+        self.file = open(filename, 'w', encoding='utf-8')  # Файл открыт на все время сканирования
+
+    def write(self, host, result):
+        port, status, service, resp_time = result
+        self.file.write(json.dumps({"host": host, "port": port, "status": status,
+                                    "service": service, "time": resp_time}, ensure_ascii=False) + "\n")
+
+    def close(self, stats):
+        self.file.close()
+        print(f"\nРезультаты сохранены в файл: {self.filename}")
+
+# накопление результатов по хостам для итоговой таблицы
+class ResultCollector:
+    def __init__(self, hosts, keep_closed=True):
+        self.keep_closed = keep_closed  # Хранить ли закрытые порты
+        self.results = {host: ResultStore() for host in hosts}  # Результаты по хостам
+        self.stats = {host: ScanStats() for host in hosts}  # Счетчики по хостам (учитывают и отброшенные)
+
+    def write(self, host, result):
+        self.stats[host].add(result[1])
+        if self.keep_closed or result[1] != "CLOSED":
+            self.results[host].append(result)
+
+    def close(self, stats):
+        pass
+
+# периодическое сохранение прогресса (контрольная точка) для --resume
+class CheckpointSink:
+    def __init__(self, filename, interval=10.0, recorded=None):
+        # recorded - {хост: {статус: PortSet}} из прошлой контрольной точки (при --resume) - сохраняется
+        self.filename = filename  # Имя файла
+        self.interval = interval  # Как часто сбрасывать на диск (сек)
+        self.state = {host: {status: PortSet.from_ranges(ports.ranges) for status, ports in statuses.items()}
+                      for host, statuses in (recorded or {}).items()}  # {хост: {статус: PortSet}}
+        self.dirty = True  # Есть изменения, которых нет в файле
+        self.last_flush = time.monotonic()  # Время последней записи
+
+    def write(self, host, result):
+        port, status = result[0], result[1]
+        if status == "ERROR":  # Ошибки при возобновлении проверяются заново
+            return
+        statuses = self.state.setdefault(host, {})
+        if status not in statuses:
+            statuses[status] = PortSet()
+        statuses[status].add(port)  # Соседние порты склеиваются в диапазоны
+        self.dirty = True
+        if time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        # Файл переписывается целиком: одна строка JSON на хост, порты каждого статуса
+        # в виде диапазонов "1-21,23-79"; замена атомарная - прерванная запись не портит точку
+        if not self.dirty:
+            return
+        temp_name = self.filename + ".tmp"
+        with open(temp_name, 'w', encoding='utf-8') as f:
+            for host, statuses in self.state.items():
+                record = {"host": host}
+                record.update((status, str(ports)) for status, ports in statuses.items() if len(ports))
+                f.write(json.dumps(record) + "\n")
+        os.replace(temp_name, self.filename)
+        self.dirty = False
+        self.last_flush = time.monotonic()
+
+    def close(self, stats):
+        self.flush()
+
+# сравнение с результатами прошлого сканирования (--since)
+class DiffSink:
+    def __init__(self, previous, restored):
+        self.previous = previous  # {хост: {статус: PortSet}} из прошлого сканирования
+        self.restored = {host: known_ports(statuses)  # {хост: PortSet} - не перепроверялись в этот раз
+                         for host, statuses in restored.items()}
+        self.rescanned = 0  # Сколько портов перепроверено
+        self.changes = []  # (хост, порт, было, стало)
+
+    def write(self, host, result):
+        port, status = result[0], result[1]
+        if port in self.restored.get(host, ()):  # Взято из прошлых результатов, не сканировалось
+            return
+        self.rescanned += 1
+        old_status = next((old for old, ports in self.previous.get(host, {}).items() if port in ports), None)
+        if old_status is not None and old_status != status:
+            self.changes.append((host, port, old_status, status))
+
+    def close(self, stats):
+        print("\n" + "-"*60)
+        print("ИЗМЕНЕНИЯ С ПРОШЛОГО СКАНИРОВАНИЯ:")
+        for host, port, old_status, status in sorted(self.changes):
+            print(f"{host} Порт {port:5d}: {old_status} -> {status}")
+        print(f"Перепроверено портов: {self.rescanned} | Изменений: {len(self.changes)}")
+
+# учет результатов в метриках, строка прогресса и выгрузка метрик
+class MetricsSink:
+    def __init__(self, metrics, progress=False, filename=None, port=None, interval=5.0):
+        # progress - строка прогресса в stderr; filename - файл метрик (.prom - Prometheus, иначе JSON)
+        # port - HTTP на 127.0.0.1: /metrics (Prometheus) и /metrics.json; interval - период записи файла
+        self.metrics = metrics  # ScanMetrics сканера
+        self.progress = progress  # Показывать прогресс
+        self.filename = filename  # Файл метрик
+        self.interval = interval  # Период записи файла, сек
+        self.stopped = threading.Event()  # Остановка фонового потока
+        self.server = None  # HTTP-сервер метрик
+        if port is not None:
+            handler = type("Handler", (_MetricsHandler,), {"metrics": metrics})
+            self.server = ThreadingHTTPServer(("127.0.0.1", port), handler)  # OSError, если порт занят
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.thread = None  # Поток прогресса и записи файла
+        if progress or filename:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def write(self, host, result):
+        self.metrics.add_result(result[1])
+
+    def close(self, stats):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.filename:  # Итоговые значения
+            self._dump()
+        if self.progress:
+            self._show_progress()
+            print(file=sys.stderr)  # Строка прогресса остается на экране
+
+    def _run(self):  # Фоновый поток: прогресс - дважды в секунду, файл - раз в interval
+        last_dump = time.monotonic()
+        while not self.stopped.wait(0.5 if self.progress else self.interval):
+            if self.progress:
+                self._show_progress()
+            if self.filename and time.monotonic() - last_dump >= self.interval:
+                self._dump()
+                last_dump = time.monotonic()
+
+    def _show_progress(self):
+        print(f"\r{self.metrics.progress_line()}\033[K", end="", file=sys.stderr, flush=True)
+
+    def _dump(self):  # Запись во временный файл и замена - читатель не увидит файл наполовину
+        snapshot = self.metrics.snapshot()
+        if self.filename.endswith(".prom"):
+            text = self.metrics.to_prometheus(snapshot)
+        else:
+            text = json.dumps(snapshot, ensure_ascii=False) + "\n"
+        try:
+            with open(self.filename + ".tmp", 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(self.filename + ".tmp", self.filename)
+        except OSError as e:  # Метрики не должны прерывать сканирование
+            print(f"\nОшибка при записи метрик: {e}", file=sys.stderr)
+
+# HTTP-обработчик метрик (metrics задается в подклассе)
+class _MetricsHandler(BaseHTTPRequestHandler):
+    metrics = None
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = self.metrics.to_prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(self.metrics.snapshot(), ensure_ascii=False), "application/json"
+        else:
+            self.send_error(404)
+            return
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # Не засоряем вывод сканера
+        pass
+
+# загрузка прошлых результатов: JSON Lines (--jsonl) или контрольная точка (--checkpoint)
+def load_scan_state(filename):
+    # Возвращает {хост: {статус: PortSet}} - порты хранятся диапазонами, а не по одному
+    state = {}
+    results = {}  # {хост: {статус: [порты]}} из строк JSON Lines
+    with open(filename, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "port" in record:  # Строка JSON Lines - один результат
+                results.setdefault(record["host"], {}).setdefault(record["status"], []).append(record["port"])
+            else:  # Запись контрольной точки - диапазоны портов по статусам
+                for status in STATUSES:
+                    if record.get(status):
+                        _merge_ports(state, record["host"], status, PortSet.from_spec(record[status]))
+    for host, statuses in results.items():
+        for status, ports in statuses.items():
+            _merge_ports(state, host, status, PortSet(ports))
+    return state
+
+# добавление портов со статусом к состоянию {хост: {статус: PortSet}}
+def _merge_ports(state, host, status, ports):
+    statuses = state.setdefault(host, {})
+    statuses[status] = statuses[status].union(ports) if status in statuses else ports
+
+# все порты хоста из {статус: PortSet} одним набором
+def known_ports(statuses):
+    return PortSet().union(*statuses.values())
+
+# результаты, взятые из контрольной точки или прошлого сканирования, в общем потоке
+def restored_results(known, scanner, service_detection=False):
+    for host, statuses in known.items():
+        for status, ports in statuses.items():
+            for port in ports:
+                service = scanner.get_service_name(port) if service_detection and status == "OPEN" else "Unknown"
+                yield host, (port, status, service, 0.0)
+
+# передача потока результатов во все приемники
+def stream_results(results, sinks):
+    # results - итератор пар (хост, результат); возвращает общую статистику
+    stats = ScanStats()  # Общие счетчики
+    try:
+        for host, result in results:
+            stats.add(result[1])
+            for sink in sinks:
+                sink.write(host, result)
+    finally:
+        for sink in sinks:  # Даже при прерывании - то, что успели, сохраняется
+            sink.close(stats)
+    return stats
+
 # Создание аргументов командной строки
 parser = argparse.ArgumentParser(
-    description='Сканер портов - утилита для проверки открытых портов на хосте',
+    description='Сканер портов - утилита для проверки открытых портов на хостах',
     epilog='Примеры использования:\n'
            '  python scanner_ports.py localhost -p 1-100\n'
            '  python scanner_ports.py 192.168.1.1 -p 20-443 -s\n'
-           '  python scanner_ports.py example.com -p 80,443,8080',
+           '  python scanner_ports.py example.com -p 80,443,8080\n'
+           '  python scanner_ports.py 192.168.1.0/24 10.0.0.5 -p 22 --host-limit 20\n'
+           '  python scanner_ports.py -iL hosts.txt -p 1-1024 --host-rate 100',
     formatter_class=argparse.RawDescriptionHelpFormatter)
 
 # обязательные и опциональные аргументы
-parser.add_argument('host', help='Целевой хост или IP-адрес для сканирования')  # Обязательный аргумент
-parser.add_argument('-p', '--ports', default='1-1000',  # Аргумент для портов
-                   help='Диапазон портов для сканирования (по умолчанию: 1-1000)')
-parser.add_argument('-t', '--threads', type=int, default=50,  # Аргумент для потоков
-                   help='Количество потоков для сканирования (по умолчанию- 50)')
+parser.add_argument('host', nargs='*',  # Цели сканирования
+                   help='Целевые хосты, IP-адреса или CIDR-сети (через пробел или запятую)')
+parser.add_argument('-iL', '--input-list', type=str,  # Файл со списком целей
+                   help='Файл со списком целей (по одной в строке)')
+parser.add_argument('-p', '--ports',  # Аргумент для портов
+                   help='Порты для сканирования: диапазоны, списки и topN, '
+                        'например 22,80-90,443,top100 (по умолчанию: 1-1000, '
+                        'с --since - порты из прошлых результатов)')
+parser.add_argument('-t', '--threads', type=int, default=500,  # Аргумент для числа подключений
+                   help='Количество одновременных подключений (по умолчанию- 500)')
 parser.add_argument('-s', '--service', action='store_true',  # Флаг определения сервисов
                    help='Определять сервисы на открытых портах')
+parser.add_argument('-b', '--banner', action='store_true',  # Чтение баннеров
+                   help='Определять сервисы открытых портов по баннеру (читается в отдельном пуле)')
+parser.add_argument('--banner-timeout', type=float, default=1.0,  # Таймаут чтения баннера
+                   help='Сколько ждать баннер, сек (по умолчанию: 1.0)')
+parser.add_argument('--banner-workers', type=int, default=50,  # Размер пула баннеров
+                   help='Сколько баннеров читать одновременно (по умолчанию: 50)')
+parser.add_argument('--banner-cache', type=str,  # Кэш определения сервисов между запусками
+                   help='Файл кэша определенных по баннеру сервисов: читается до и сохраняется после сканирования')
+parser.add_argument('--banner-cache-ttl', type=float, default=86400.0,  # Срок годности записей кэша
+                   help='Сколько секунд записи --banner-cache считаются актуальными (по умолчанию: 86400)')
 parser.add_argument('-a', '--all', action='store_true',  # Флаг показа всех портов
                    help='Показывать все порты (включая закрытые)')
 parser.add_argument('--timeout', type=float, default=2.0,  # Аргумент для таймаута
-                   help='Таймаут соединения в секундах (по умолчанию: 2.0)')
+                   help='Максимальный таймаут соединения в секундах (по умолчанию: 2.0)')
+parser.add_argument('--fixed-timeout', action='store_true',  # Отключить адаптивный таймаут
+                   help='Всегда ждать полный --timeout, не подбирать таймаут по RTT')
+parser.add_argument('--min-timeout', type=float, default=0.05,  # Нижняя граница таймаута
+                   help='Минимальный адаптивный таймаут в секундах (по умолчанию: 0.05)')
+parser.add_argument('--retries', type=int, default=1,  # Повторные попытки
+                   help='Повторные попытки для портов без ответа при адаптивном таймауте (по умолчанию: 1)')
 parser.add_argument('-o', '--output', type=str,  # Аргумент для сохранения в файл
                    help='Сохранить результаты в указанный файл')
 parser.add_argument('--desc', action='store_true',  # Флаг для сортировки по убыванию
                    help='Сортировать результаты по порту (от большего к меньшему)')
+parser.add_argument('--stream', action='store_true',  # Потоковый вывод
+                   help='Выводить и сохранять результаты сразу по мере получения (без итоговой сортировки)')
+parser.add_argument('--jsonl', type=str,  # Файл JSON Lines
+                   help='Сохранять результаты в файл JSON Lines по мере получения')
+parser.add_argument('--drop-closed', action='store_true',  # Не хранить закрытые порты
+                   help='Не хранить закрытые порты в памяти (учитываются только в статистике)')
+parser.add_argument('-w', '--workers', type=int, default=1,  # Число процессов
+                   help='Количество процессов для сканирования; -t делится между ними (по умолчанию: 1)')
+parser.add_argument('--checkpoint', type=str,  # Файл контрольной точки
+                   help='Периодически сохранять просканированные пары (хост, порт) в файл')
+parser.add_argument('--checkpoint-interval', type=float, default=10.0,  # Период сохранения
+                   help='Как часто сохранять контрольную точку, сек (по умолчанию: 10)')
+parser.add_argument('--resume', action='store_true',  # Продолжить прерванное сканирование
+                   help='Продолжить сканирование: пропустить пары из файла --checkpoint')
+parser.add_argument('--since', type=str,  # Прошлые результаты
+                   help='Файл прошлых результатов (--jsonl или --checkpoint): перепроверить открытые '
+                        'порты и выборку остальных, показать изменения')
+parser.add_argument('--sample', type=float, default=0.05,  # Доля перепроверки
+                   help='Доля неоткрытых портов из --since, которые перепроверяются (по умолчанию: 0.05)')
+parser.add_argument('--progress', action='store_true',  # Строка прогресса
+                   help='Показывать прогресс, скорость и оставшееся время (в stderr)')
+parser.add_argument('--metrics', type=str,  # Файл метрик
+                   help='Периодически сохранять метрики в файл (.prom - формат Prometheus, иначе JSON)')
+parser.add_argument('--metrics-port', type=int,  # HTTP-порт метрик
+                   help='Отдавать метрики по HTTP на 127.0.0.1:PORT (/metrics и /metrics.json)')
+parser.add_argument('--metrics-interval', type=float, default=5.0,  # Период записи метрик
+                   help='Как часто сохранять файл --metrics, сек (по умолчанию: 5)')
+parser.add_argument('--dns-workers', type=int, default=16,  # Пул разрешения имен
+                   help='Сколько имен разрешать одновременно (по умолчанию: 16)')
+parser.add_argument('--dns-ttl', type=float, default=300.0,  # Время жизни кэша имен
+                   help='Сколько секунд хранить разрешенные адреса в кэше (по умолчанию: 300)')
+family_group = parser.add_mutually_exclusive_group()  # Семейство адресов
+family_group.add_argument('-4', '--ipv4', action='store_true',  # Только IPv4
+                          help='Сканировать только IPv4-адреса целей')
+family_group.add_argument('-6', '--ipv6', action='store_true',  # Только IPv6
+                          help='Сканировать только IPv6-адреса целей')
+parser.add_argument('--host-limit', type=int,  # Лимит подключений к одному хосту
+                   help='Максимум одновременных подключений к одному хосту (включая чтение баннеров)')
+parser.add_argument('--host-rate', type=float,  # Лимит скорости для одного хоста
+                   help='Максимум новых подключений к одному хосту в секунду')
 
-# аргументы из командной строки
-args = parser.parse_args()
+# Запуск сканера из командной строки
+def main():
+    # аргументы из командной строки
+    args = parser.parse_args()
 
-# Обработка диапазона портов
-if '-' in args.ports:  # случай - указан диапазон через дефис
-    try:
-        start_port, end_port = map(int, args.ports.split('-'))  # происходит разделение и преобразование в числа
-    except ValueError:  # - не удалось преобразовать в числа
-        print("Ошибка! некорректный формат диапазона портов. Используйте 'начальный-конечный'")
+    # Прошлые результаты для --since
+    previous = None  # {хост: {статус: PortSet}}
+    if args.since:
+        try:
+            previous = load_scan_state(args.since)
+        except (OSError, ValueError, KeyError) as e:  # Нет файла или неизвестный формат
+            print(f"Ошибка! не удалось прочитать прошлые результаты {args.since}: {e}")
+            sys.exit(1)  # Завершение программы с ошибкой
+    if args.resume and not args.checkpoint:  # некуда/неоткуда брать прогресс
+        print("Ошибка! для --resume укажите файл контрольной точки (--checkpoint)")
         sys.exit(1)  # Завершение программы с ошибкой
-elif ',' in args.ports:  # Если указаны конкретные порты через запятую
+
+    # Обработка портов: "1-1000", "22,80,443", "22,80-90,top100"
     try:
-        port_list = [int(p.strip()) for p in args.ports.split(',')]  # список портов
-        start_port, end_port = min(port_list), max(port_list)  # Определение диапазона
-    except ValueError:  # -не удалось преобразовать в числа
-        print("Ошибка! некорректный список портов. Используйте - 'порт1,порт2,порт3'")
+        if args.ports is None and previous:  # порты прошлого сканирования
+            ports = PortSet().union(*(known_ports(statuses) for statuses in previous.values()))
+        else:
+            ports = PortSet.from_spec(args.ports or '1-1000')  # Набор портов без повторов
+    except ValueError as e:  # - не удалось разобрать спецификацию
+        print(f"Ошибка! некорректный список портов ({e}). Используйте, например, '22,80-90,443,top100'")
+        sys.exit(1)  # Завершение программы с ошибкой
+    start_port, end_port = ports.first, ports.last  # Границы набора
+    if args.workers < 1:  # некорректное число процессов
+        print("Ошибка! количество процессов должно быть не меньше 1")
+        sys.exit(1)  # Завершение программы с ошибкой
+    if args.dns_workers < 1:  # некорректный размер пула разрешения имен
+        print("Ошибка! количество одновременных разрешений имен должно быть не меньше 1")
+        sys.exit(1)  # Завершение программы с ошибкой
+    if args.banner and args.banner_workers < 1:  # некорректный размер пула баннеров
+        print("Ошибка! количество одновременных чтений баннеров должно быть не меньше 1")
+        sys.exit(1)  # Завершение программы с ошибкой
+    if not 0 <= args.sample <= 1:  # доля перепроверяемых портов вне диапазона
+        print("Ошибка! доля перепроверки (--sample) должна быть от 0 до 1")
         sys.exit(1)  # Завершение программы с ошибкой
-else:  # - указан один порт
+
+    # Раскрываем цели: CIDR-сети, списки через запятую и файл со списком
     try:
-        start_port = end_port = int(args.ports)  # Оба порта равны указанному
-    except ValueError:  # - не удалось преобразовать в число
-        print("Ошибка! порт должен быть числом")
+        hosts = parse_targets(args.host, args.input_list)  # Список хостов без повторов
+    except (ValueError, OSError) as e:  # Некорректная сеть или не читается файл
+        print(f"Ошибка! некорректный список целей: {e}")
+        sys.exit(1)  # Завершение программы с ошибкой
+    if not hosts and previous:  # цели прошлого сканирования
+        hosts = list(previous)
+    if not hosts:  # Не указано ни одной цели
+        print("Ошибка! укажите хотя бы один хост или файл со списком (-iL)")
         sys.exit(1)  # Завершение программы с ошибкой
-        
-# Валидируем входные данные
-print(f"\nПроверка параметров...")  # Сообщение простое с информацией 
-is_valid, message = validate_input(args.host, start_port, end_port)  # Вызов валидации
-if not is_valid:  # - валидация не пройдена
-    print(f"Ошибка: {message}")  # сообщение об ошибке
-    sys.exit(1)  # Завершение программы с ошибкой
-    
-# Создание сканера и начало сканирования
-print(f"Начало сканирования {args.host} (порты {start_port}-{end_port})...")  # Информация
-print(f"Используется {args.threads} потоков, таймаут: {args.timeout} сек")  # Параметры
-
-if args.service:  # если включено определение сервисов
-    print("Определение сервисов: ВКЛЮЧЕНО")  # Информация о статусе если включено определение
-if args.desc:  # если включена сортировка по убыванию
-    print("Сортировка по порту (от большего к меньшему): ВКЛЮЧЕНО")  # Информация о сортировке
-    
-scanner = PortScanner(args.host, args.timeout)  # - объект сканера
-start_time = time.time()  # Засекаем время начала сканирования
 
-try:
-    # Запускаем сканирование
-    results = scanner.scan_range(  # метод сканирования
-        start_port, end_port,  # Диапазон портов
-        args.threads,  # Количество потоков
-        args.service  # Определение сервисов
-        )
-    scan_time = time.time() - start_time  # Вычисление времени сканирования
-    
-    # Вывод результатов
-    display_results(results, args.all, args.desc)  # функция отображения результатов
-    print(f"\nСканирование завершено за {scan_time:.2f} секунд")  # Время выполнения функции
-    
-    # Сохранение результатов в файл если указан аргумент -o
-    if args.output:
-        save_results_to_file(args.output, results, args.host)
-        
-except KeyboardInterrupt:  # Ctrl+C
-    print("\n\nСканирование прервано (Ctrl+C)")
-    sys.exit(0)  # Завершение программы
-    
-except Exception as e:  # если другая ошибка
-    print(f"\nПроизошла ошибка при сканировании: {str(e)}")
-    sys.exit(1)  # завершение программы с ошибкой
\ No newline at end of file
+    # Разрешаем имена один раз, параллельно - дальше адреса берутся из кэша
+    family = socket.AF_INET if args.ipv4 else socket.AF_INET6 if args.ipv6 else socket.AF_UNSPEC
+    resolver = Resolver(args.dns_ttl, family=family, workers=args.dns_workers)
+    resolve_start = time.time()
+    resolved = resolver.resolve_many(hosts)
+    if resolver.lookups:  # были доменные имена
+        print(f"\nРазрешено имен: {resolver.lookups} за {time.time() - resolve_start:.2f} сек")
+        names = [host for host in hosts if host in resolver.cache and not isinstance(resolved[host], socket.gaierror)]
+        multi = [host for host in names if len(resolved[host]) > 1]  # Имена с несколькими адресами
+        # Адрес, который будет сканироваться: для всех имен, если их немного, иначе - только
+        # для имен с несколькими адресами (не больше MAX_NAMES_SHOWN строк) и итог
+        shown = names if len(names) <= MAX_NAMES_SHOWN else multi[:MAX_NAMES_SHOWN]
+        for host in shown:
+            addresses = resolved[host]
+            skipped = f" (другие адреса не сканируются: {len(addresses) - 1})" if len(addresses) > 1 else ""
+            print(f"{host} -> {addresses[0][1][0]}{skipped}")
+        if len(shown) < len(multi):
+            print(f"Имен с несколькими адресами: {len(multi)} - сканируется только первый адрес каждого")
+
+    # Неразрешимые имена не останавливают сканирование остальных целей
+    unresolved = [host for host in hosts if isinstance(resolved[host], socket.gaierror)]
+    for host in unresolved:
+        print(f"Предупреждение: не удается разрешить хост {host} - пропускается")
+    if unresolved:
+        hosts = [host for host in hosts if not isinstance(resolved[host], socket.gaierror)]
+        if not hosts:  # Сканировать нечего
+            print("Ошибка! не удалось разрешить ни один хост")
+            sys.exit(1)  # Завершение программы с ошибкой
+
+    # Валидируем входные данные
+    print(f"\nПроверка параметров...")  # Сообщение простое с информацией 
+    for host in hosts:  # Проверяем каждую цель
+        is_valid, message = validate_input(host, start_port, end_port, resolver)  # Вызов валидации
+        if not is_valid:  # - валидация не пройдена
+            print(f"Ошибка: {message}")  # сообщение об ошибке
+            sys.exit(1)  # Завершение программы с ошибкой
+
+    # Создание сканера и начало сканирования
+    targets_info = hosts[0] if len(hosts) == 1 else f"{len(hosts)} хостов"  # Что сканируем
+    print(f"Начало сканирования {targets_info} (порты {ports}, всего {len(ports)})...")  # Информация
+    print(f"Одновременных подключений: {args.threads}, таймаут: {args.timeout} сек")  # Параметры
+
+    if args.service:  # если включено определение сервисов
+        print("Определение сервисов: ВКЛЮЧЕНО")  # Информация о статусе если включено определение
+    if args.banner:  # если включено чтение баннеров
+        print(f"Чтение баннеров: ВКЛЮЧЕНО (одновременно {args.banner_workers}, таймаут {args.banner_timeout} сек)")
+    if args.desc:  # если включена сортировка по убыванию
+        print("Сортировка по порту (от большего к меньшему): ВКЛЮЧЕНО")  # Информация о сортировке
+    if args.workers > 1:  # если сканирование в нескольких процессах
+        print(f"Процессов: {args.workers}")
+    if args.host_limit or args.host_rate:  # если заданы лимиты на хост
+        print(f"Лимиты на хост: подключений {args.host_limit or '-'}, в секунду {args.host_rate or '-'}")
+
+    if not args.fixed_timeout:  # если таймаут подбирается по RTT
+        print(f"Адаптивный таймаут: от {args.min_timeout} сек, повторных попыток: {args.retries}")
+
+    banner_grabber = (BannerGrabber(args.banner_timeout, args.banner_workers, cache_ttl=args.banner_cache_ttl)
+                      if args.banner else None)
+    if banner_grabber is not None and args.banner_cache and os.path.exists(args.banner_cache):
+        try:
+            banner_grabber.load(args.banner_cache)  # Сервисы с тем же баннером определяются без пробы
+        except (OSError, ValueError, KeyError) as e:  # Поврежденный кэш - начинаем с пустого
+            print(f"Кэш баннеров {args.banner_cache} не прочитан ({e}) - используется пустой")
+    metrics = None  # Счетчики - только если их кто-то смотрит
+    if args.progress or args.metrics or args.metrics_port is not None:
+        metrics = ScanMetrics(total=len(hosts) * len(ports))
+    scanner = PortScanner(hosts[0], args.timeout, not args.fixed_timeout,  # - объект сканера
+                          args.retries, args.min_timeout, banner_grabber, metrics, resolver)
+
+    # Заранее известные результаты - эти пары не сканируются
+    checkpoint_state = None  # {хост: {статус: PortSet}} - вся контрольная точка, остается в файле
+    checkpointed = {}  # {хост: {статус: PortSet}} - текущие хосты и порты из контрольной точки
+    if args.resume and os.path.exists(args.checkpoint):
+        try:
+            checkpoint_state = load_scan_state(args.checkpoint)
+        except (OSError, ValueError, KeyError) as e:  # Файл не читается или поврежден
+            # Сканирование с начала перезаписало бы контрольную точку - останавливаемся
+            print(f"Ошибка! не удалось прочитать контрольную точку {args.checkpoint}: {e}")
+            sys.exit(1)  # Завершение программы с ошибкой
+        for host in hosts:
+            done = {status: found.intersection(ports) for status, found in checkpoint_state.get(host, {}).items()
+                    if status != "ERROR"}
+            done = {status: found for status, found in done.items() if len(found)}
+            if done:
+                checkpointed[host] = done
+        done_count = sum(len(found) for done in checkpointed.values() for found in done.values())
+        print(f"Возобновление: уже просканировано {done_count} пар")
+    elif args.resume:
+        print(f"Контрольная точка {args.checkpoint} не найдена - сканирование с начала")
+    known = {host: dict(done) for host, done in checkpointed.items()}  # Все пары, которые не сканируются
+    if previous is not None:  # --since: открытые порты и выборка остальных перепроверяются
+        for host in hosts:
+            scanned = known_ports(known.get(host, {}))
+            for status in ("CLOSED", "FILTERED"):
+                if status not in previous.get(host, {}):
+                    continue
+                candidates = previous[host][status].intersection(ports).difference(scanned)
+                rescan = candidates.sample(round(len(candidates) * args.sample))  # Случайная доля перепроверяется
+                kept = candidates.difference(rescan)
+                if len(kept):
+                    _merge_ports(known, host, status, kept)
+        print(f"Сравнение с {args.since}: перепроверяются открытые порты и {args.sample:.0%} остальных")
+    start_time = time.time()  # Засекаем время начала сканирования
+
+    try:
+        # Приемники результатов
+        collector = None  # Накопитель для итоговой отсортированной таблицы
+        sinks = []
+        if args.stream:  # результаты сразу на экран и в файл
+            print("Потоковый вывод: ВКЛЮЧЕН")
+            sinks.append(ConsoleSink(args.all, len(hosts) > 1))
+            if args.output:
+                sinks.append(TextFileSink(args.output, targets_info))
+        else:  # результаты собираются для итоговой таблицы
+            collector = ResultCollector(hosts, keep_closed=not args.drop_closed)
+            sinks.append(collector)
+        if args.jsonl:  # JSON Lines пишется всегда по мере получения
+            sinks.append(JsonLinesSink(args.jsonl))
+        if args.checkpoint:  # контрольная точка: при --resume прошлый прогресс сохраняется в ней
+            sinks.append(CheckpointSink(args.checkpoint, args.checkpoint_interval, checkpoint_state))
+        if metrics is not None:  # прогресс и выгрузка метрик
+            sinks.append(MetricsSink(metrics, args.progress, args.metrics, args.metrics_port,
+                                     args.metrics_interval))
+            if args.metrics_port is not None:
+                print(f"Метрики: http://127.0.0.1:{args.metrics_port}/metrics")
+        if previous is not None:  # отчет об изменениях
+            sinks.append(DiffSink(previous, known))
+
+        # Запускаем сканирование
+        skip = {host: known_ports(statuses) for host, statuses in known.items()}  # {хост: PortSet}
+        if args.workers > 1:  # несколько процессов - пары (хост, порт) делятся между ними
+            results_stream = scanner.iter_scan_sharded(
+                hosts, ports, args.workers, args.threads, args.service, args.host_limit, args.host_rate,
+                skip=skip)
+        else:
+            results_stream = scanner.iter_scan(  # метод сканирования
+                hosts,  # Все цели - общий планировщик подключений
+                ports,  # Набор портов
+                args.threads,  # Количество одновременных подключений
+                args.service,  # Определение сервисов
+                args.host_limit,  # Лимит подключений к одному хосту
+                args.host_rate,  # Лимит скорости для одного хоста
+                skip  # Пропускаемые пары
+                )
+        # Сначала - заранее известные результаты, потом - новые
+        results_stream = chain(restored_results(known, scanner, args.service), results_stream)
+        stats = stream_results(results_stream, sinks)  # Результаты проходят через приемники
+        scan_time = time.time() - start_time  # Вычисление времени сканирования
+
+        # Вывод результатов
+        if collector is not None:
+            for host, results in collector.results.items():  # Результаты каждого хоста
+                if len(hosts) > 1:  # несколько хостов - подписываем каждый
+                    print(f"\n\nХост: {host}")
+                display_results(results, args.all, args.desc, collector.stats[host])  # функция отображения результатов
+        if collector is None or len(hosts) > 1:  # общая статистика
+            print("\n" + "-"*60)
+            print("ОБЩАЯ СТАТИСТИКА:")
+            print(stats.summary())
+        print(f"\nСканирование завершено за {scan_time:.2f} секунд")  # Время выполнения функции
+
+        # Сохранение результатов в файл если указан аргумент -o
+        if args.output and collector is not None:
+            for i, (host, results) in enumerate(collector.results.items()):
+                save_results_to_file(args.output, results, host, append=i > 0,  # Все хосты в один файл
+                                     stats=collector.stats[host])
+
+    except KeyboardInterrupt:  # Ctrl+C
+        print("\n\nСканирование прервано (Ctrl+C)")
+        sys.exit(0)  # Завершение программы
+
+    except Exception as e:  # если другая ошибка
+        print(f"\nПроизошла ошибка при сканировании: {str(e)}")
+        sys.exit(1)  # завершение программы с ошибкой
+
+    finally:  # кэш баннеров сохраняется и после прерывания
+        if banner_grabber is not None and args.banner_cache:
+            try:
+                banner_grabber.save(args.banner_cache)
+            except OSError as e:
+                print(f"Не удалось сохранить кэш баннеров {args.banner_cache}: {e}")
+
+
+# Запуск только при вызове как скрипта (воркер-процессы и бенчмарк импортируют модуль)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import random
+import unittest
+
+from scanner import PortSet
+
+
+# Набор по спецификации - короче в проверках
+def spec(text):
+    return PortSet.from_spec(text)
+
+
+class PortSetSpecTest(unittest.TestCase):
+    def test_mixed_spec_is_merged_and_sorted(self):
+        self.assertEqual(str(spec("443,80-90,85-100,22")), "22,80-100,443")
+
+    def test_open_bounds(self):
+        self.assertEqual(str(spec("-3,65534-")), "1-3,65534-65535")
+
+    def test_adjacent_ranges_join(self):
+        self.assertEqual(spec("1-5,6-10").ranges, [range(1, 11)])
+
+    def test_invalid_specs(self):
+        for text in ("", "0", "10-5", "65536", "top0", "abc"):
+            with self.assertRaises(ValueError, msg=text):
+                spec(text)
+
+
+class PortSetAlgebraTest(unittest.TestCase):
+    def test_add_joins_neighbours(self):
+        ports = spec("1-3,5-7")
+        ports.add(4)
+        self.assertEqual(ports.ranges, [range(1, 8)])
+        ports.add(2)  # Уже есть
+        ports.add(10)
+        self.assertEqual(str(ports), "1-7,10")
+
+    def test_union(self):
+        self.assertEqual(str(spec("1-5,20").union(spec("4-10"), spec("21"))), "1-10,20-21")
+
+    def test_intersection(self):
+        self.assertEqual(str(spec("1-10,20-30").intersection(spec("5-25"))), "5-10,20-25")
+        self.assertEqual(len(spec("1-10").intersection(spec("11-20"))), 0)
+
+    def test_difference(self):
+        self.assertEqual(str(spec("1-10").difference(spec("3,5-6,10"))), "1-2,4,7-9")
+        self.assertEqual(len(spec("1-10").difference(spec("1-10"))), 0)
+
+    def test_sample(self):
+        ports = spec("1-10,100-110")
+        picked = ports.sample(5)
+        self.assertEqual(len(picked), 5)
+        self.assertEqual(len(picked.difference(ports)), 0)
+
+    def test_matches_python_sets(self):
+        rng = random.Random(1)
+        for _ in range(200):
+            a = set(rng.sample(range(1, 100), 40))
+            b = set(rng.sample(range(1, 100), 40))
+            left, right = PortSet(a), PortSet(b)
+            self.assertEqual(list(left.union(right)), sorted(a | b))
+            self.assertEqual(list(left.intersection(right)), sorted(a & b))
+            self.assertEqual(list(left.difference(right)), sorted(a - b))
+            for port in range(101):
+                self.assertEqual(port in left, port in a)
+            added = PortSet()
+            for port in a:
+                added.add(port)
+            self.assertEqual(added.ranges, left.ranges)
+
+
+class PortStripeTest(unittest.TestCase):
+    def test_stripes_cover_set_once(self):
+        ports = spec("1-10,20,30-35")
+        stripes = [ports.stripe(index, 3) for index in range(3)]
+        self.assertEqual(sorted(port for stripe in stripes for port in stripe), list(ports))
+        self.assertEqual(sum(len(stripe) for stripe in stripes), len(ports))
+
+    def test_stripe_membership(self):
+        stripe = spec("1-10").stripe(0, 2)
+        self.assertEqual(list(stripe), [1, 3, 5, 7, 9])
+        self.assertIn(5, stripe)
+        self.assertNotIn(4, stripe)
+
+    def test_stripe_to_port_set(self):  # Обычный набор из доли - с диапазонами шага 1
+        stripe = spec("1-10").stripe(0, 2)
+        self.assertEqual(str(PortSet.of(stripe).intersection(spec("1-10"))), "1,3,5,7,9")
+
+
+if __name__ == '__main__':
+    unittest.main()